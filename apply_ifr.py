@@ -4,7 +4,16 @@
 # countries' population pyramids in order to calculate their overall IFR.
 # Author: Marc Bevand — @zorinaq
 
-import pandas as pd
+import argparse
+import csv
+import hashlib
+import os
+import sys
+import numpy as np
+import export_ifr
+import ifr_registry
+import instrument
+from pyramid_store import Pyramids
 
 # Pyramid data is from the United Nations: this file is a CSV export of the first sheet
 # of "Population by Age Groups - Both Sexes" linked from:
@@ -13,137 +22,190 @@ import pandas as pd
 # https://population.un.org/wpp/Download/Files/1_Indicators%20(Standard)/EXCEL_FILES/1_Population/WPP2019_POP_F07_1_POPULATION_BY_AGE_BOTH_SEXES.xlsx
 file_pyramids = 'WPP2019_POP_F07_1_POPULATION_BY_AGE_BOTH_SEXES.csv'
 
-maxage = 100
+# The same data by sex ("Population by Age Groups - Male" and "- Female", same
+# layout), used by --by-sex, in the order of ifr_registry.sexes. They are not
+# included in this repository.
+files_pyramids_sex = {
+        'male': 'WPP2019_POP_F07_2_POPULATION_BY_AGE_MALE.csv',
+        'female': 'WPP2019_POP_F07_3_POPULATION_BY_AGE_FEMALE.csv',
+}
+
+# Parsed pyramids are cached in this directory (see load_pyramids)
+cache_dir = '.cache'
+
+# Age-stratified IFR estimates (see ifr_models.py)
+registry = ifr_registry.load()
+
+maxage = registry.maxage
 
 # Age groups defined in the CSV file
 age_groups = [(0,4), (5,9), (10,14), (15,19), (20,24), (25,29), (30,34), (35,39), (40,44), (45,49), (50,54), (55,59), (60,64), (65,69), (70,74), (75,79), (80,84), (85,89), (90,94), (95,99), (100,maxage)]
 
-# This will hold parsed pyramid data. Example to get the number of people in the
-# age group 20-24 in France: pyramid['France'][(20,24)]
-pyramid = {}
-
-# For a description of cdc_sympt, see the same variable name defined in covid_vs_flu.py
-cdc_sympt = .33
-
-# Various age-stratified IFR estimates
-ifrs = [
-
-        # Calculated from Spanish ENE-COVID study
-        # (see calc_ifr.py)
-        ('ENE-COVID', {
-            (0,9):    0.003,
-            (10,19):  0.004,
-            (20,29):  0.015,
-            (30,39):  0.030,
-            (40,49):  0.064,
-            (50,59):  0.213,
-            (60,69):  0.718,
-            (70,79):  2.384,
-            (80,89):  8.466,
-            (90,maxage): 12.497,
-        }),
-
-        # US CDC estimate as of 19 Mar 2021
-        # https://www.cdc.gov/coronavirus/2019-ncov/hcp/planning-scenarios.html
-        # (table 1)
-        ('COVID: US CDC', {
-            (0,17):   0.002,
-            (18,49):  0.05,
-            (50,64):  0.6,
-            (65,maxage): 9.0,
-        }),
-
-        # Verity et al.
-        # https://www.thelancet.com/journals/laninf/article/PIIS1473-3099(20)30243-7/fulltext
-        # (table 1)
-        ('COVID: Verity', {
-            (0,9):    0.00161,
-            (10,19):  0.00695,
-            (20,29):  0.0309,
-            (30,39):  0.0844,
-            (40,49):  0.161,
-            (50,59):  0.595,
-            (60,69):  1.93,
-            (70,79):  4.28,
-            (80,maxage): 7.80,
-        }),
-
-        # Levin et al.
-        # https://link.springer.com/article/10.1007/s10654-020-00698-1
-        # (table 3)
-        ('COVID: Levin', {
-            (0,34):   0.004,
-            (35,44):  0.068,
-            (45,54):  0.23,
-            (55,64):  0.75,
-            (65,74):  2.5,
-            (75,84):  8.5,
-            (85,maxage): 28.3,
-        }),
-
-        # Brazeau et al.
-        # https://www.imperial.ac.uk/mrc-global-infectious-disease-analysis/covid-19/report-34-ifr/
-        # (table 2, column "IFR (%) with Seroreversion")
-        ('COVID: Brazeau', {
-            (0,4):    0.00,
-            (5,9):    0.01,
-            (10,14):  0.01,
-            (15,19):  0.02,
-            (20,24):  0.02,
-            (25,29):  0.04,
-            (30,34):  0.06,
-            (35,39):  0.09,
-            (40,44):  0.15,
-            (45,49):  0.23,
-            (50,54):  0.36,
-            (55,59):  0.57,
-            (60,64):  0.89,
-            (65,69):  1.39,
-            (70,74):  2.17,
-            (75,79):  3.39,
-            (80,84):  5.30,
-            (85,89):  8.28,
-            (90,maxage): 16.19,
-        }),
-
-        # IFR for seasonal influenza
-        # US CDC 2019-2020 influenza burden
-        # https://www.cdc.gov/flu/about/burden/2019-2020.html
-        ('Flu: US CDC', {
-            (0,4):              254/4_291_677 * 100 * cdc_sympt,
-            (5,17):             180/8_214_257 * 100 * cdc_sympt,
-            (18,49):            2_669/15_325_708 * 100 * cdc_sympt,
-            (50,64):            5_133/8_416_702 * 100 * cdc_sympt,
-            (65,maxage):        13_673/1_946_161 * 100 * cdc_sympt,
-        }),
-
-]
+# Types of the regions whose overall IFR is calculated: countries, world, and
+# continents
+shown_types = ('Country/Area', 'World', 'Region')
+
+# This will hold parsed pyramid data (a pyramid_store.Pyramids of the regions of
+# shown_types). Example to get the number of people in the age group 20-24 in
+# France: pyramids.row('France')[age_groups.index((20,24))]
+pyramids = None
+
+# For a description of cdc_sympt, see the same variable name defined in ifr_models.py
+cdc_sympt = registry.cdc_sympt
+
+# Estimates applied to the pyramids, as {<label in the table>: <name in ifr_models.py>}
+labels = {
+        'ENE-COVID': 'ENE-COVID',
+        'COVID: US CDC': 'US CDC',
+        'COVID: Verity': 'Verity',
+        'COVID: Levin': 'Levin',
+        'COVID: Brazeau': 'Brazeau',
+        'Flu: US CDC': 'US CDC 2019-2020',
+}
+
+ifrs = registry.select(labels)
+
+# 95% intervals of the estimates, for the models and age groups where the source
+# publishes them (used by montecarlo_ifr.py)
+ifr_intervals = {label: registry.intervals[name] for (label, name) in labels.items()
+        if name in registry.intervals}
 
 def ag2str(age_group):
     if age_group[1] == maxage:
         return f'{age_group[0]}+'
     return f'{age_group[0]}-{age_group[1]}'
 
-def parse_pyramids():
-    df = pd.read_csv(file_pyramids)
-    # ignore labels as they don't contain any data
-    df = df[df['Type'] != 'Label/Separator']
-    # only take rows with data as of 2020
-    df = df[df['Reference date (as of 1 July)'] == 2020]
-    # only parse countries, world, and continents
-    df = df[df['Type'].isin(('Country/Area', 'World', 'Region'))]
-    # remove spaces used as thousands separators, and convert cell values to floats
-    columns = [ag2str(x) for x in age_groups]
-    for col in columns:
-        df[col] = df[col].str.replace('\s+', '').astype(float)
-    regions = list(df['Region, subregion, country or area *'])
-    #regions = ('France',)
-    for region in regions:
-        pyramid[region] = {}
-        df_region = df[df['Region, subregion, country or area *'] == region]
-        for ag in age_groups:
-            # values are in thousands
-            pyramid[region][ag] = 1000 * float(df_region[ag2str(ag)])
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def read_pyramids_csv(year, path=file_pyramids):
+    # Slow path: parse <path> with pandas. Returns the Pyramids of all the
+    # regions as of <year>
+    with instrument.span('apply_ifr.import_pandas'):
+        import pandas as pd
+    with instrument.span('apply_ifr.read_csv'):
+        df = pd.read_csv(path, dtype=str)
+    with instrument.span('apply_ifr.filter_rows'):
+        # only take rows with data as of <year>
+        df = df[df['Reference date (as of 1 July)'].astype(int) == year]
+    with instrument.span('apply_ifr.thousands_separators'):
+        # remove spaces used as thousands separators, and convert cell values to
+        # floats (labels have '...' instead of data)
+        columns = [ag2str(x) for x in age_groups]
+        values = df[columns].replace({r'\s+': '', r'^\.\.\.$': 'nan'},
+                regex=True).astype(float).to_numpy()
+    # values are in thousands
+    return Pyramids(list(df['Region, subregion, country or area *']), 1000 * values,
+            list(df['Type']), df['Country code'].astype(int).to_numpy(),
+            df['Parent code'].astype(int).to_numpy())
+
+def load_all_pyramids(year=2020, path=file_pyramids):
+    # Returns the Pyramids of all the regions as of <year>, with a (read-only,
+    # memory-mapped) array of people. The parsed data is cached in cache_dir,
+    # keyed by the hash of <path> and the year, so that only the first run
+    # after the file changes has to parse it.
+    key = f'{file_hash(path)}-{year}'
+    path_values = os.path.join(cache_dir, f'pyramids-all-{key}.npy')
+    path_meta = os.path.join(cache_dir, f'pyramids-all-{key}.npz')
+    if not (os.path.exists(path_values) and os.path.exists(path_meta)):
+        instrument.count('pyramid cache misses')
+        p = read_pyramids_csv(year, path)
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to temporary files first so concurrent runs never see partial files
+        tmp = f'.tmp{os.getpid()}'
+        with open(path_values + tmp, 'wb') as f:
+            np.save(f, p.values)
+        with open(path_meta + tmp, 'wb') as f:
+            np.savez(f, regions=np.array(p.regions), types=np.array(p.types),
+                    codes=p.codes, parents=p.parents)
+        os.replace(path_values + tmp, path_values)
+        os.replace(path_meta + tmp, path_meta)
+    with np.load(path_meta) as meta:
+        return Pyramids(meta['regions'].tolist(), np.load(path_values, mmap_mode='r'),
+                meta['types'].tolist(), meta['codes'], meta['parents'])
+
+def load_pyramids(year=2020):
+    # Returns the list of regions of shown_types and a regions × age_groups array
+    # of people as of <year>
+    p = load_all_pyramids(year).select(shown_types)
+    return p.regions, p.values
+
+def parse_pyramids(year=2020):
+    global pyramids
+    with instrument.span('apply_ifr.load_pyramids'):
+        pyramids = load_all_pyramids(year).select(shown_types)
+    instrument.count('regions parsed', len(pyramids))
+
+def load_sex_pyramids(year=2020):
+    # Returns the Pyramids of the regions of shown_types as of <year> from
+    # files_pyramids_sex, whose values are a regions × (sexes · age_groups) array:
+    # the age groups of the first sex, then those of the second
+    (male, female) = (load_all_pyramids(year, files_pyramids_sex[sex]).select(shown_types)
+            for sex in ifr_registry.sexes)
+    if male.regions != female.regions:
+        raise ValueError('the pyramid files of both sexes do not list the same regions')
+    return Pyramids(male.regions, np.hstack((male.values, female.values)), male.types,
+            male.codes, male.parents)
+
+def parse_count(cell):
+    # Returns the number of people of a cell of a pyramid file: spaces are
+    # thousands separators, and cells without data ('...' or empty) are NaN, as
+    # in read_pyramids_csv (the overall IFRs of such rows are NaN)
+    cell = ''.join(cell.split())
+    return float('nan') if cell in ('...', '') else float(cell)
+
+def stream_pyramids(files, chunk_size=1024):
+    # Streams every reference year of the countries, world, and continents found in
+    # <files> (which must have the same layout as file_pyramids) without holding
+    # them in memory. Yields chunks of at most <chunk_size> rows as tuples:
+    # (<list of (region, year)>, <rows × age_groups array of people>)
+    for path in files:
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            i_region = header.index('Region, subregion, country or area *')
+            i_type = header.index('Type')
+            i_year = header.index('Reference date (as of 1 July)')
+            i_groups = [header.index(ag2str(ag)) for ag in age_groups]
+            keys, rows = [], []
+            for row in reader:
+                if row[i_type] not in shown_types:
+                    continue
+                keys.append((row[i_region], int(row[i_year])))
+                rows.append([parse_count(row[i]) for i in i_groups])
+                if len(rows) == chunk_size:
+                    # values are in thousands
+                    yield keys, 1000 * np.array(rows)
+                    keys, rows = [], []
+            if rows:
+                yield keys, 1000 * np.array(rows)
+
+def calc_ifr_trajectories(files, chunk_size=1024):
+    # Yields (<region>, <year>, <ifr_according_to_1st_estimate>, ...) for every
+    # row of <files>, one chunk at a time
+    for (keys, groups) in stream_pyramids(files, chunk_size):
+        instrument.count('regions parsed', len(keys))
+        oifrs = overall_ifr_matrix(groups, ifrs)
+        for ((region, year), row) in zip(keys, oifrs.tolist()):
+            yield (region, year, *row)
+
+def show_ifr_trajectories(trajectories):
+    def header():
+        print('| Year ', end='')
+        for i in ifrs:
+            print(f'| {i[0]:>13} ', end='')
+        print('| Region |')
+    header()
+    for (region, year, *oifrs) in trajectories:
+        print(f'| {year:4} ', end='')
+        for i in oifrs:
+            print(f'| {i:13.3f} ', end='')
+        print(f'| {region} |')
+    header()
 
 def people_of_age(pyramid_region, age):
     # Returns the number of people of exact age 'age', given the provided age pyramid
@@ -158,42 +220,376 @@ def overall_ifr(pyramid_region, ifr_age_stratified):
         for age in range(age_group[0], age_group[1] + 1):
             pop += people_of_age(pyramid_region, age)
             deaths += people_of_age(pyramid_region, age) * ifr / 100.0
-    assert pop == sum(pyramid_region.values())
+    if pop != sum(pyramid_region.values()):
+        raise ValueError('the model does not cover every age of the pyramid')
     return 100.0 * deaths / pop
 
-def calc_overall_ifrs():
-    oifrs = []
-    for region in pyramid.keys():
-        # The overall IFRs are appended to the array in the same order as listed in ifrs
-        tmp = []
-        for i in ifrs:
-            ifr_age_stratified = i[1]
-            # calculate the overall IFR for region, using IFR estimate ifr_age_stratified
-            tmp.append(overall_ifr(pyramid[region], ifr_age_stratified))
-        oifrs.append((region, *tmp))
+# Methods to split the 5-year age groups of the pyramids into single years of age:
+# - 'uniform': people are spread uniformly inside each age group (same as
+#   people_of_age, used for the published results)
+# - 'sprague': Sprague fifth-difference osculatory interpolation
+splits = ('uniform', 'sprague')
+
+# Sprague multipliers: each panel gives the 5 single-year values of an age group
+# (rows) from the totals of 5 consecutive age groups (columns). The panels for
+# the last two groups are those of the first two, reversed.
+sprague_first = np.array([
+        [ 0.3616, -0.2768,  0.1488, -0.0336,  0.0000],
+        [ 0.2640, -0.0960,  0.0400, -0.0080,  0.0000],
+        [ 0.1840,  0.0400, -0.0320,  0.0080,  0.0000],
+        [ 0.1200,  0.1360, -0.0720,  0.0160,  0.0000],
+        [ 0.0704,  0.1968, -0.0848,  0.0176,  0.0000]])
+sprague_second = np.array([
+        [ 0.0336,  0.2272, -0.0752,  0.0144,  0.0000],
+        [ 0.0080,  0.2320, -0.0480,  0.0080,  0.0000],
+        [-0.0080,  0.2160, -0.0080,  0.0000,  0.0000],
+        [-0.0160,  0.1840,  0.0400, -0.0080,  0.0000],
+        [-0.0176,  0.1408,  0.0912, -0.0144,  0.0000]])
+sprague_middle = np.array([
+        [-0.0128,  0.0848,  0.1504, -0.0240,  0.0016],
+        [-0.0016,  0.0144,  0.2224, -0.0416,  0.0064],
+        [ 0.0064, -0.0336,  0.2544, -0.0336,  0.0064],
+        [ 0.0064, -0.0416,  0.2224,  0.0144, -0.0016],
+        [ 0.0016, -0.0240,  0.1504,  0.0848, -0.0128]])
+
+def sprague_matrix(n):
+    # Returns the (5 * n) × n matrix splitting <n> consecutive 5-year age groups
+    # into single years of age
+    m = np.zeros((5 * n, n))
+    for i in range(n):
+        if i == 0:
+            (panel, first) = (sprague_first, 0)
+        elif i == 1:
+            (panel, first) = (sprague_second, 0)
+        elif i == n - 2:
+            (panel, first) = (sprague_second[::-1, ::-1], n - 5)
+        elif i == n - 1:
+            (panel, first) = (sprague_first[::-1, ::-1], n - 5)
+        else:
+            (panel, first) = (sprague_middle, i - 2)
+        m[5 * i:5 * i + 5, first:first + 5] = panel
+    return m
+
+def expand_age_groups(groups, split='uniform'):
+    # Converts a regions × age_groups matrix (people per age group, columns in the
+    # same order as age_groups) into a regions × single-year-ages matrix, using
+    # the method <split> (see splits)
+    groups = np.asarray(groups, dtype=float)
+    people = np.empty((groups.shape[0], maxage + 1))
+    for (j, (a, b)) in enumerate(age_groups):
+        people[:, a:b + 1] = groups[:, j, None] / float(b - a + 1)
+    if split == 'sprague':
+        # all age groups but the last one (maxage) span 5 years
+        n = len(age_groups) - 1
+        people[:, :5 * n] = groups[:, :n] @ sprague_matrix(n).T
+        # interpolation can give a few negative counts at very old ages: clip
+        # them and rescale each age group so that its total is unchanged
+        np.clip(people, 0, None, out=people)
+        for (j, (a, b)) in enumerate(age_groups[:n]):
+            total = people[:, a:b + 1].sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ratio = np.where(total > 0, groups[:, j] / total, 0)
+            people[:, a:b + 1] *= ratio[:, None]
+    elif split != 'uniform':
+        raise ValueError(f'unknown split method: {split}')
+    return people
+
+def prefix_sums(people):
+    # Returns the cumulative sums of a regions × single-year-ages matrix, with a
+    # leading column of zeros, so that the number of people of ages a to b
+    # (inclusive) is people_between(cum, a, b), in constant time
+    cum = np.zeros((people.shape[0], people.shape[1] + 1))
+    np.cumsum(people, axis=1, out=cum[:, 1:])
+    return cum
+
+def people_between(cum, a, b):
+    return cum[:, min(b, cum.shape[1] - 2) + 1] - cum[:, a]
+
+def cumulative_people(groups, split='uniform'):
+    # Returns the prefix sums (see prefix_sums) of the pyramids in <groups> (see
+    # expand_age_groups) and the mask of the invalid ones (see invalid_pyramids),
+    # whose rows are zero
+    groups = np.asarray(groups, dtype=float)
+    invalid = invalid_pyramids(groups)
+    groups = np.where(invalid[:, None], 0, groups)
+    return prefix_sums(expand_age_groups(groups, split)), invalid
+
+def pyramids_cumulative_people(p, split='uniform'):
+    # Same as cumulative_people for the Pyramids <p>, calculated once per split
+    # method and kept with them
+    if split not in p.derived:
+        p.derived[split] = cumulative_people(p.values, split)
+    return p.derived[split]
+
+def ifr_matrix(models):
+    # Returns two single-year-ages × models matrices: the IFR (in %) of each model
+    # at each age, and a mask of the ages covered by each model
+    ifr = np.zeros((maxage + 1, len(models)))
+    covered = np.zeros((maxage + 1, len(models)))
+    for (j, (name, ifr_age_stratified)) in enumerate(models):
+        # models of the registry are already compiled to single years of age
+        vector = registry.vector(name, ifr_age_stratified)
+        if vector is not None:
+            covered[:, j] = ~np.isnan(vector)
+            ifr[:, j] = np.nan_to_num(vector)
+            continue
+        for ((a, b), val) in ifr_age_stratified.items():
+            ifr[a:b + 1, j] = val
+            covered[a:b + 1, j] = 1
+    return ifr, covered
+
+def compiled_ifr_matrix(vectors):
+    # Same as ifr_matrix, from a models × single-year-ages array of IFRs that are
+    # NaN at the ages not covered by a model (rows of registry.ifr, see
+    # registry_rows)
+    vectors = np.asarray(vectors, dtype=float).T
+    return np.nan_to_num(vectors), (~np.isnan(vectors)).astype(float)
+
+def registry_rows(models):
+    # Returns the rows of registry.ifr of <models>. Raises ValueError for a model
+    # that is not in the registry, or that was edited since it was loaded.
+    rows = [registry.row(name, m) for (name, m) in models]
+    if None in rows:
+        raise ValueError(f'not a model of the registry: {models[rows.index(None)][0]}')
+    return rows
+
+def prefix_matrices(ifr, covered):
+    # Converts the single-year-ages × models matrices returned by ifr_matrix into
+    # two (single-year-ages + 1) × models matrices such that, multiplied by
+    # prefix sums of people (see prefix_sums), they give the deaths (in % of
+    # people) and the people at the ages covered by each model: the people of an
+    # age group [a, b] are the difference of the prefix sums at b + 1 and a, so
+    # the matrices are only nonzero at the bounds of the age groups
+    out = []
+    for m in (ifr, covered):
+        zeros = np.zeros((1, m.shape[1]))
+        out.append(np.vstack((zeros, m)) - np.vstack((m, zeros)))
+    return out
+
+def bracket_matrix(models):
+    # Returns the prefix_matrices of <models>
+    return prefix_matrices(*ifr_matrix(models))
+
+def sex_ifr_tensor(models):
+    # Same as ifr_matrix, with the IFR of each model for each sex: returns a
+    # sexes × single-year-ages × models tensor and an ages × models mask.
+    # Models without IFRs by sex have the same IFR for both sexes.
+    (ifr, covered) = ifr_matrix(models)
+    ifr = np.repeat(ifr[None], len(ifr_registry.sexes), axis=0)
+    for (j, (name, ifr_age_stratified)) in enumerate(models):
+        vectors = registry.sex_vectors(name, ifr_age_stratified)
+        if vectors is not None:
+            ifr[:, :, j] = np.nan_to_num(vectors)
+    return ifr, covered
+
+def invalid_pyramids(groups):
+    # Returns a mask of the rows of <groups> that are not valid pyramids: with a
+    # missing (NaN), infinite or negative number of people in an age group
+    groups = np.asarray(groups, dtype=float)
+    return ~np.isfinite(groups).all(axis=1) | (groups < 0).any(axis=1)
+
+def check_coverage(pop, total, models):
+    # Raises ValueError unless every model covers every age of every pyramid:
+    # <pop> is the regions × models matrix of the people at the ages covered by
+    # each model, <total> the number of people of each pyramid
+    uncovered = ~np.isclose(pop, total[:, None]).all(axis=0)
+    if uncovered.any():
+        names = ', '.join(models[j][0] for j in np.flatnonzero(uncovered))
+        raise ValueError(f'models not covering every age: {names}')
+
+def overall_ifr_matrix(groups, models, split='uniform', cum=None, brackets=None):
+    # Vectorized version of overall_ifr: returns a regions × models matrix of
+    # overall IFRs for the pyramids in <groups> (see expand_age_groups). The
+    # rows of invalid pyramids (see invalid_pyramids) are NaN. <cum> and
+    # <brackets> are the outputs of cumulative_people for <groups> and of
+    # bracket_matrix for <models>, if already calculated.
+    with instrument.span('apply_ifr.overall_ifr_matrix'):
+        (cum, invalid) = cumulative_people(groups, split) if cum is None else cum
+        (ifr, covered) = bracket_matrix(models) if brackets is None else brackets
+        pop = cum @ covered
+        deaths = cum @ ifr / 100.0
+        check_coverage(pop, cum[:, -1], models)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = 100.0 * deaths / pop
+        out[invalid] = np.nan
+    instrument.count('models evaluated', len(models))
+    instrument.count('overall IFRs calculated', cum.shape[0] * len(models))
+    return out
+
+def overall_ifr_sex_matrix(groups, models, split='uniform'):
+    # Same as overall_ifr_matrix, for pyramids by sex: <groups> is a regions ×
+    # (sexes · age_groups) matrix (see load_sex_pyramids)
+    with instrument.span('apply_ifr.overall_ifr_sex_matrix'):
+        groups = np.asarray(groups, dtype=float)
+        invalid = invalid_pyramids(groups)
+        groups = np.where(invalid[:, None], 0, groups)
+        (n, nsexes) = (groups.shape[0], len(ifr_registry.sexes))
+        people = expand_age_groups(groups.reshape(n * nsexes, -1), split).reshape(n, nsexes, -1)
+        (ifr, covered) = sex_ifr_tensor(models)
+        pop = people.sum(axis=1) @ covered
+        # contraction 'rsa,sam->rm', as a single matrix product
+        deaths = people.reshape(n, -1) @ ifr.reshape(-1, len(models)) / 100.0
+        check_coverage(pop, groups.sum(axis=1), models)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = 100.0 * deaths / pop
+        out[invalid] = np.nan
+    instrument.count('models evaluated', len(models))
+    instrument.count('overall IFRs calculated', n * len(models))
+    return out
+
+def stored_overall_ifr_matrix(groups, models, store, split='uniform', cum=None):
+    # Same as overall_ifr_matrix, but only calculates the cells missing from
+    # <store> (a result_store.ResultStore), and adds them to it
+    from result_store import pyramid_fingerprint, model_fingerprint
+    groups = np.asarray(groups, dtype=float)
+    pyramid_keys = [pyramid_fingerprint(row, split) for row in groups]
+    model_keys = [model_fingerprint(m[1]) for m in models]
+    oifrs = store.lookup(pyramid_keys, model_keys, [m[0] for m in models])
+    missing = np.isnan(oifrs)
+    rows = np.flatnonzero(missing.any(axis=1))
+    cols = np.flatnonzero(missing.any(axis=0))
+    instrument.count('overall IFRs from store', int((~missing).sum()))
+    if len(rows):
+        if cum is not None:
+            cum = (cum[0][rows], cum[1][rows])
+        block = overall_ifr_matrix(groups[rows], [models[j] for j in cols], split, cum)
+        cells = []
+        for (i, r) in enumerate(rows):
+            for (j, c) in enumerate(cols):
+                if missing[r, c]:
+                    oifrs[r, c] = block[i, j]
+                    cells.append((pyramid_keys[r], model_keys[c], float(block[i, j])))
+        store.insert(cells)
     return oifrs
 
+def calc_overall_ifr_matrix(store=None, split='uniform'):
+    # Returns the list of regions and the regions × models array of their overall
+    # IFRs, the models being listed in the same order as in ifrs
+    (regions, groups) = (pyramids.regions, pyramids.values)
+    cum = pyramids_cumulative_people(pyramids, split)
+    if store is None:
+        return regions, overall_ifr_matrix(groups, ifrs, split, cum)
+    return regions, stored_overall_ifr_matrix(groups, ifrs, store, split, cum)
+
+def calc_overall_ifrs(store=None, split='uniform'):
+    (regions, oifrs) = calc_overall_ifr_matrix(store, split)
+    return [(region, *row) for (region, row) in zip(regions, oifrs.tolist())]
+
 def show_overall_ifrs(oifrs):
-    def header():
-        for i in ifrs:
-            print(f'| {i[0]:>13} ', end='')
-        print('| Region |')
     # Each entry in the oifrs array is a tuple:
     # (<region_name>, <ifr_according_to_1st_estimate>, <ifr_according_to_2nd_estimate>, ...)
     # Sort by element index 1, that is by <ifr_according_to_1st_estimate>
     # To sort by region name, use index 0 (x[0])
     oifrs.sort(key=lambda x: x[1], reverse=True)
-    header()
-    for region in oifrs:
-        for i in region[1:]:
-            print(f'| {i:13.3f} ', end='')
-        print(f'| {region[0]} |')
-    header()
+    instrument.count('rows shown', len(oifrs))
+    export_ifr.write_table([x[0] for x in oifrs], [i[0] for i in ifrs],
+            np.array([x[1:] for x in oifrs]).reshape(len(oifrs), len(ifrs)))
+
+def positive_int(value):
+    # argparse type of the arguments that must be positive integers
+    n = int(value)
+    if n <= 0:
+        raise argparse.ArgumentTypeError(f'must be a positive integer: {value}')
+    return n
+
+def add_arguments(parser):
+    parser.add_argument('--year', type=int, default=2020,
+            help='reference year of the pyramids (default: %(default)s)')
+    parser.add_argument('--trajectories', nargs='*', metavar='FILE',
+            help='stream every reference year of FILE(s) (default: the '
+            'pyramid file) and show the overall IFRs over time')
+    parser.add_argument('--chunk-size', type=positive_int, default=1024,
+            help='rows per chunk in --trajectories mode (default: %(default)s)')
+    parser.add_argument('--store', nargs='?', const=os.path.join(cache_dir,
+            'results.sqlite'), metavar='FILE',
+            help='reuse the overall IFRs stored in FILE (default: %(const)s) '
+            'and only calculate the missing ones')
+    parser.add_argument('--groups', metavar='FILE',
+            help='also calculate the overall IFR of the custom groupings of '
+            'regions of FILE (JSON: {"<group>": ["<region>", ...]})')
+    parser.add_argument('--by-sex', action='store_true',
+            help='use the pyramids of each sex (files_pyramids_sex) and the IFRs '
+            'of each sex, for the models that have them')
+    parser.add_argument('--split', choices=splits, default='uniform',
+            help='how to split 5-year age groups into single years of age '
+            '(default: %(default)s)')
+    parser.add_argument('--format', choices=export_ifr.formats, default='text',
+            help='output format (default: %(default)s)')
+    parser.add_argument('--output', metavar='FILE',
+            help='output file (default: standard output)')
+    parser.add_argument('--sort', metavar='COLUMN',
+            choices=['Region'] + [name for (name, _) in ifrs],
+            help='sort by this model, or by Region (default: the first model)')
+    parser.add_argument('--ascending', action='store_true',
+            help='sort in ascending order')
+    parser.add_argument('--precision', type=int, default=3,
+            help='decimals in the text and markdown formats (default: %(default)s)')
+    parser.add_argument('--evict-after', type=float, default=7, metavar='DAYS',
+            help='with --store, forget the results of models that are no '
+            'longer in ifrs after DAYS (default: %(default)s)')
+    # run reports the arguments found invalid only once the data is loaded
+    # (such as unknown regions in --groups) like the parser does
+    parser.set_defaults(error=parser.error)
+
+def group_pyramids(args, p):
+    # Returns the Pyramids of the custom groupings of regions of --groups
+    from pyramid_store import read_groups
+    try:
+        return p.group(read_groups(args.groups))
+    except ValueError as e:
+        args.error(f'argument --groups: {e}')
+
+def run(args):
+    if args.by_sex:
+        run_by_sex(args)
+        return
+    if args.trajectories is not None:
+        files = args.trajectories or [file_pyramids]
+        show_ifr_trajectories(calc_ifr_trajectories(files, args.chunk_size))
+        return
+    parse_pyramids(args.year)
+    if args.store:
+        from result_store import ResultStore, model_fingerprint
+        os.makedirs(os.path.dirname(args.store) or '.', exist_ok=True)
+        store = ResultStore(args.store)
+        (regions, oifrs) = calc_overall_ifr_matrix(store, args.split)
+        store.evict([model_fingerprint(m[1]) for m in ifrs], args.evict_after * 86400)
+        store.close()
+    else:
+        (regions, oifrs) = calc_overall_ifr_matrix(split=args.split)
+    if args.groups:
+        groups = group_pyramids(args, pyramids)
+        regions = regions + groups.regions
+        oifrs = np.vstack((oifrs, overall_ifr_matrix(groups.values, ifrs, args.split)))
+    show_table(args, regions, oifrs)
+
+def run_by_sex(args):
+    if args.store or args.trajectories is not None:
+        sys.exit('--store and --trajectories are not supported with --by-sex')
+    missing = [path for path in files_pyramids_sex.values() if not os.path.exists(path)]
+    if missing:
+        sys.exit(f'missing pyramid file(s) by sex: {", ".join(missing)}')
+    p = load_sex_pyramids(args.year)
+    (regions, oifrs) = (p.regions, overall_ifr_sex_matrix(p.values, ifrs, args.split))
+    if args.groups:
+        groups = group_pyramids(args, p)
+        regions = regions + groups.regions
+        oifrs = np.vstack((oifrs, overall_ifr_sex_matrix(groups.values, ifrs, args.split)))
+    show_table(args, regions, oifrs)
+
+def show_table(args, regions, oifrs):
+    models = [name for (name, _) in ifrs]
+    (regions, oifrs) = export_ifr.sort_table(regions, models, oifrs, args.sort,
+            not args.ascending)
+    instrument.count('rows shown', len(regions))
+    export_ifr.write_table(regions, models, oifrs, args.format, args.output,
+            args.precision)
 
 def main():
-    parse_pyramids()
-    oifrs = calc_overall_ifrs()
-    show_overall_ifrs(oifrs)
+    parser = argparse.ArgumentParser(description='Calculate the overall IFR of '
+            'COVID-19 and the seasonal flu from population pyramids.')
+    add_arguments(parser)
+    run(parser.parse_args())
 
 if __name__ == '__main__':
     main()
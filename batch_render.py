@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+#
+# Render many variants of the chart of covid_vs_flu.py (model subsets, languages,
+# styles, formats) in parallel, skipping the figures that are already up to date.
+# Author: Marc Bevand — @zorinaq
+#
+# Jobs are read from a JSON file holding a list of objects such as:
+#   {"output": "figures/covid_vs_flu_fr.svg", "lang": "fr",
+#    "covid": ["Verity", "Levin"], "flu": ["US CDC 2019-2020"],
+#    "style": {"dpi": 150}}
+# Only "output" is required. "covid" and "flu" list model names from
+# covid_vs_flu.ifrs_covid and covid_vs_flu.ifrs_flu (default: all models),
+# "style" overrides entries of covid_vs_flu.style.
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib
+# headless backend, must be selected before pyplot is imported
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import covid_vs_flu
+
+# Fingerprints of the figures rendered so far are stored in this file, in the
+# current directory
+file_manifest = '.render-manifest.json'
+
+def select(ifr_models, names):
+    if names is None:
+        return ifr_models
+    by_name = dict(ifr_models)
+    return [(name, by_name[name]) for name in names]
+
+def resolve(job):
+    # Returns the inputs of a job: model data, language and style
+    style = dict(covid_vs_flu.style, **job.get('style', {}))
+    return {
+            'covid': select(covid_vs_flu.ifrs_covid, job.get('covid')),
+            'flu': select(covid_vs_flu.ifrs_flu, job.get('flu')),
+            'lang': job.get('lang', 'en'),
+            'style': style,
+    }
+
+def fingerprint(job, inputs):
+    # Hash of everything the figure depends on: its inputs, its output format,
+    # and the drawing code itself
+    h = hashlib.sha1()
+    with open(covid_vs_flu.__file__, 'rb') as f:
+        h.update(f.read())
+    data = {
+            'covid': [(name, sorted(m.items())) for (name, m) in inputs['covid']],
+            'flu': [(name, sorted(m.items())) for (name, m) in inputs['flu']],
+            'lang': inputs['lang'],
+            'style': sorted(inputs['style'].items()),
+            'format': os.path.splitext(job['output'])[1],
+    }
+    h.update(repr(data).encode())
+    return h.hexdigest()
+
+# Figure reused, with its axes and their styling (see covid_vs_flu.render), by
+# all the jobs of a worker process (see init_worker)
+_fig = None
+
+def init_worker():
+    global _fig
+    _fig = plt.figure()
+
+def render_job(job):
+    inputs = resolve(job)
+    os.makedirs(os.path.dirname(job['output']) or '.', exist_ok=True)
+    covid_vs_flu.render(job['output'], inputs['covid'], inputs['flu'],
+            inputs['lang'], inputs['style'], fig=_fig)
+    return job['output']
+
+def load_manifest():
+    try:
+        with open(file_manifest) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(manifest):
+    tmp = f'{file_manifest}.tmp{os.getpid()}'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, file_manifest)
+
+def render_all(jobs, workers=None, force=False):
+    # Renders the jobs whose output is missing or whose fingerprint changed, and
+    # returns the list of outputs rendered
+    manifest = load_manifest()
+    todo = {}
+    for job in jobs:
+        fp = fingerprint(job, resolve(job))
+        if force or manifest.get(job['output']) != fp or \
+                not os.path.exists(job['output']):
+            todo[job['output']] = (job, fp)
+    done = []
+    if not todo:
+        return done
+    with ProcessPoolExecutor(workers, initializer=init_worker) as executor:
+        futures = [executor.submit(render_job, job) for (job, _) in todo.values()]
+        for future in as_completed(futures):
+            output = future.result()
+            manifest[output] = todo[output][1]
+            save_manifest(manifest)
+            done.append(output)
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(description='Render variants of the COVID-19 '
+            'vs. seasonal influenza chart in parallel.')
+    parser.add_argument('jobs', help='JSON file listing the figures to render')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+            help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--force', action='store_true',
+            help='render all figures, even those that are up to date')
+    args = parser.parse_args()
+    with open(args.jobs) as f:
+        jobs = json.load(f)
+    done = render_all(jobs, args.workers, args.force)
+    print(f'{len(done)} figure(s) rendered, {len(jobs) - len(done)} up to date')
+
+if __name__ == '__main__':
+    main()
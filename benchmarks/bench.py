@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+#
+# Benchmark suite: times pyramid parsing, IFR aggregation, interpolation and
+# rendering on synthetic inputs of increasing size, and checks that the results
+# still match the tables published in README.md.
+# Author: Marc Bevand — @zorinaq
+#
+#   bench.py run [--quick] [--output FILE]    run the benchmarks (and the check)
+#   bench.py compare BASELINE CURRENT         flag regressions between two runs
+#   bench.py check                            only check the results in README.md
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+import apply_ifr
+import calc_ifr
+import covid_vs_flu
+from pyramid_store import Pyramids
+
+#
+# Synthetic inputs
+#
+
+def synthetic_pyramids(nregions, rng):
+    # Returns Pyramids like apply_ifr.pyramids (whole thousands of people, like
+    # the UN data)
+    values = 1000.0 * rng.integers(1, 1000, size=(nregions, len(apply_ifr.age_groups)))
+    return Pyramids([f'Region {i}' for i in range(nregions)], values)
+
+def synthetic_models(nmodels, fine, rng):
+    # Returns models in the layout of apply_ifr.ifrs, covering ages 0 to maxage.
+    # Fine models have 5-year age groups, coarse ones 3 to 6 random age groups.
+    models = []
+    for i in range(nmodels):
+        if fine:
+            starts = list(range(0, apply_ifr.maxage, 5))
+        else:
+            cuts = rng.choice(np.arange(5, 90), size=rng.integers(2, 6), replace=False)
+            starts = [0] + sorted(cuts.tolist())
+        ends = [s - 1 for s in starts[1:]] + [apply_ifr.maxage]
+        ifr = np.sort(rng.uniform(1e-3, 10, size=len(starts)))
+        models.append((f'Model {i}', dict(zip(zip(starts, ends), ifr.tolist()))))
+    return models
+
+#
+# Timing
+#
+
+def timeit(func, repeat=3, min_time=.1):
+    # Returns the best time per call of func(), calling it enough times per
+    # repetition to last about min_time seconds
+    start = time.perf_counter()
+    func()
+    best = time.perf_counter() - start
+    number = max(1, min(1 << 20, int(min_time / max(best, 1e-9))))
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+@contextlib.contextmanager
+def swapped(module, **values):
+    # Temporarily replaces attributes of a module
+    saved = {name: getattr(module, name) for name in values}
+    for (name, value) in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for (name, value) in saved.items():
+            setattr(module, name, value)
+
+def bench_parse(results):
+    with tempfile.TemporaryDirectory() as tmp:
+        def cold():
+            shutil.rmtree(tmp, ignore_errors=True)
+            apply_ifr.parse_pyramids()
+        with swapped(apply_ifr, cache_dir=tmp, pyramids=None):
+            results['parse_pyramids (cold cache)'] = timeit(cold, repeat=2)
+            results['parse_pyramids (warm cache)'] = timeit(apply_ifr.parse_pyramids)
+
+def bench_aggregation(results, sizes, rng):
+    for (nregions, nmodels) in sizes:
+        for fine in (True, False):
+            pyramids = synthetic_pyramids(nregions, rng)
+            models = synthetic_models(nmodels, fine, rng)
+            kind = 'fine' if fine else 'coarse'
+            with swapped(apply_ifr, pyramids=pyramids, ifrs=models):
+                results[f'calc_overall_ifrs ({nregions} regions, {nmodels} {kind} models)'] = \
+                        timeit(apply_ifr.calc_overall_ifrs, repeat=2)
+            region = dict(zip(apply_ifr.age_groups, pyramids.values[0].tolist()))
+            results[f'overall_ifr (1 region, 1 {kind} model)'] = \
+                    timeit(lambda: apply_ifr.overall_ifr(region, models[0][1]))
+
+def bench_infected(results):
+    results['calc_ifr.get_infected (all brackets)'] = \
+            timeit(lambda: [calc_ifr.get_infected(b) for b in calc_ifr.deaths_by_age])
+    results['calc_ifr.bootstrap (1000 replicates)'] = \
+            timeit(lambda: calc_ifr.bootstrap(1000), repeat=2)
+
+def bench_interpolation(results, nmodels, rng):
+    for fine in (True, False):
+        kind = 'fine' if fine else 'coarse'
+        models = synthetic_models(nmodels, fine, rng)
+        def cold():
+            covid_vs_flu.compiled.clear()
+            for age in range(covid_vs_flu.maxage + 1):
+                covid_vs_flu.mean_ifr(age, models)
+        results[f'mean_ifr (ages 0-{covid_vs_flu.maxage}, {nmodels} {kind} models, cold)'] = \
+                timeit(cold, repeat=2)
+        results[f'ifr_for_model (1 age, 1 {kind} model, warm)'] = \
+                timeit(lambda: covid_vs_flu.ifr_for_model(55, models[0]))
+
+def bench_render(results):
+    import matplotlib
+    matplotlib.use('Agg')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'covid_vs_flu.png')
+        results['covid_vs_flu render'] = timeit(lambda: covid_vs_flu.render(path),
+                repeat=1)
+
+#
+# Check against README.md
+#
+
+def readme_tables():
+    # Returns the overall IFR table (header, {region: [values]}) and the output
+    # of calc_ifr.py, as published in README.md
+    with open(os.path.join(root, 'README.md'), encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    i = lines.index('## Results')
+    while not lines[i].startswith('|'):
+        i += 1
+    header = [x.strip() for x in lines[i].strip('|').split('|')][:-1]
+    table = {}
+    for line in lines[i + 2:]:
+        if not line.startswith('|'):
+            break
+        cells = [x.strip() for x in line.strip().strip('|').split('|')]
+        table[cells[-1]] = cells[:-1]
+    i = lines.index('$ ./calc_ifr.py') + 1
+    calc = lines[i:lines.index('```', i)]
+    return header, table, calc
+
+def check_readme():
+    # Returns a list of mismatches between the current results and README.md
+    (header, table, calc) = readme_tables()
+    errors = []
+    if header != [name for (name, _) in apply_ifr.ifrs]:
+        errors.append(f'models differ: {header}')
+    with swapped(apply_ifr, pyramids=None):
+        apply_ifr.parse_pyramids()
+        oifrs = {region: row for (region, *row) in apply_ifr.calc_overall_ifrs()}
+    for (region, published) in table.items():
+        if region not in oifrs:
+            errors.append(f'region missing: {region}')
+        elif [f'{x:.3f}' for x in oifrs[region]] != published:
+            errors.append(f'{region}: {published} published, '
+                    f'{[f"{x:.3f}" for x in oifrs[region]]} calculated')
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        calc_ifr.run(argparse.Namespace(bootstrap=0, seed=0, surveys=None))
+    for (published, line) in zip(calc, out.getvalue().splitlines()):
+        if published != line:
+            errors.append(f'calc_ifr.py: {line!r} instead of {published!r}')
+    return errors
+
+#
+# Commands
+#
+
+def cmd_run(args):
+    errors = check_readme()
+    for e in errors:
+        print(f'MISMATCH: {e}')
+    if errors:
+        sys.exit(1)
+    rng = np.random.default_rng(0)
+    if args.quick:
+        sizes, nmodels = [(250, 6), (1000, 10)], 10
+    else:
+        sizes = [(250, 6), (10_000, 10), (100_000, 10), (1000, 1000)]
+        nmodels = 1000
+    results = {}
+    bench_parse(results)
+    bench_aggregation(results, sizes, rng)
+    bench_infected(results)
+    bench_interpolation(results, nmodels, rng)
+    bench_render(results)
+    for (name, t) in results.items():
+        print(f'{t * 1e3:12.3f} ms  {name}')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+def cmd_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = 0
+    for (name, t) in current.items():
+        if name not in baseline:
+            continue
+        ratio = t / baseline[name]
+        flag = ''
+        if ratio > 1 + args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f'{ratio:7.2f}x  {name}{flag}')
+    if regressions:
+        sys.exit(1)
+
+def cmd_check(args):
+    errors = check_readme()
+    for e in errors:
+        print(f'MISMATCH: {e}')
+    print('README.md tables match' if not errors else f'{len(errors)} mismatch(es)')
+    if errors:
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    sub = subparsers.add_parser('run', help='run the benchmarks')
+    sub.add_argument('--quick', action='store_true', help='small inputs only')
+    sub.add_argument('--output', metavar='FILE', help='write the results to FILE (JSON)')
+    sub.set_defaults(func=cmd_run)
+    sub = subparsers.add_parser('compare', help='compare two results files')
+    sub.add_argument('baseline')
+    sub.add_argument('current')
+    sub.add_argument('--threshold', type=float, default=.2,
+            help='flag slowdowns above this fraction (default: %(default)s)')
+    sub.set_defaults(func=cmd_compare)
+    sub = subparsers.add_parser('check', help='check the results against README.md')
+    sub.set_defaults(func=cmd_check)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+#
+# Measure the startup time of each subcommand of ifr.py, and the cost of the
+# modules it imports (from python -X importtime).
+# Author: Marc Bevand — @zorinaq
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# subcommand: arguments
+runs = {
+        'table': ['table'],
+        'plot': ['plot', '--output', os.path.join(tempfile.gettempdir(), 'ifr_startup.png')],
+        'calc': ['calc'],
+}
+
+# Heavy libraries whose import cost is reported separately
+heavy = ('numpy', 'pandas', 'matplotlib', 'scipy')
+
+def parse_importtime(stderr):
+    # Returns {<top-level package>: <cumulative import time in seconds>}
+    costs = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        (_, cumulative, name) = line[12:].split('|')
+        # nested imports are indented after the separator's single space
+        if not name[1:].startswith(' '):
+            name = name.strip()
+            costs[name] = costs.get(name, 0) + int(cumulative) / 1e6
+    return costs
+
+def measure(args, repeat):
+    # Returns the best wall time of <repeat> runs, and the import costs of the
+    # last one
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        p = subprocess.run([sys.executable, '-X', 'importtime', 'ifr.py', *args],
+                cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                text=True, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, parse_importtime(p.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of the '
+            'subcommands of ifr.py.')
+    parser.add_argument('--repeat', type=int, default=5,
+            help='runs per subcommand, the best is kept (default: %(default)s)')
+    parser.add_argument('--json', metavar='FILE',
+            help='also write the results to FILE')
+    args = parser.parse_args()
+    results = {}
+    print(f'| {"Subcommand":>10} | {"Wall (s)":>8} | {"Imports (s)":>11} | Heavy imports |')
+    for (name, argv) in runs.items():
+        (wall, costs) = measure(argv, args.repeat)
+        results[name] = {'wall': wall, 'imports': costs}
+        packages = {}
+        for (m, cost) in costs.items():
+            packages[m.split('.')[0]] = packages.get(m.split('.')[0], 0) + cost
+        loaded = ', '.join(f'{m} {packages[m]:.3f}' for m in heavy if m in packages)
+        print(f'| {name:>10} | {wall:8.3f} | {sum(costs.values()):11.3f} | {loaded or "-"} |')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,11 @@
 # serosurvey of 63564 participants.
 # Author: Marc Bevand — @zorinaq
 
+import argparse
+import sys
+import numpy as np
+import instrument
+
 # Prevalence of antibodies by age bracket, in % (serosurvey dates: 18-May-2020 to 01-June-2020)
 # Source: https://portalcne.isciii.es/enecovid19/ene_covid19_inf_pre2.pdf (table 1)
 prevalence_by_age = {
@@ -29,6 +34,9 @@ prevalence_by_age = {
         (90,199): 8.0,
         }
 
+# Number of participants in the serosurvey
+participants = 63564
+
 # Total deaths, and number of deaths by age bracket (as of 29-May-2020)
 # Source: https://www.mscbs.gob.es/profesionales/saludPublica/ccayes/alertasActual/nCov-China/documentos/Actualizacion_120_COVID-19.pdf (table 2 and table 3)
 # Total deaths (27121) differs from the total for all age brackets (20585)
@@ -46,13 +54,11 @@ deaths_by_age = {
         (80,89): 8463,
         (90,199): 4423,
         }
-deaths_by_age[(0,199)] = total_brackets = sum(deaths_by_age.values()) # 20585
 
 # To properly calculate the IFR, we need to account for the extra 6536 deaths
 # for which age information was not available, so we simply assume they are
-# distributed proportionally (not equally) among age brackets
-for bracket in deaths_by_age:
-    deaths_by_age[bracket] *= (total_deaths / total_brackets)
+# distributed proportionally (not equally) among age brackets (see
+# redistribute_deaths)
 
 # Population pyramid for Spain (age 0 to 100)
 # Source: https://worldpopulationreview.com/countries/spain-population/
@@ -71,21 +77,118 @@ pyramid_spain = [
         131040,113392,91852,66359,48324,40084,32862,24229,14184,8251,
         12310]
 
+def prevalence_vector(prevalence=None):
+    '''Returns the prevalence (in %) at each single year of age of pyramid_spain.
+    <prevalence> is an array whose last axis lists the brackets of
+    prevalence_by_age in order (default: the values of prevalence_by_age), the
+    result has the same leading axes.'''
+    if prevalence is None:
+        prevalence = list(prevalence_by_age.values())
+    index = np.zeros(len(pyramid_spain), dtype=int)
+    for (i, (a, b)) in enumerate(prevalence_by_age):
+        index[a:b + 1] = i
+    return np.asarray(prevalence, dtype=float)[..., index]
+
+def infected_by_bracket(brackets, prevalence=None):
+    '''Returns the number of infected people in each of the given age brackets,
+    given a single-year <prevalence> vector, or array of vectors, as returned by
+    prevalence_vector (default: the point estimates).'''
+    if prevalence is None:
+        prevalence = prevalence_vector()
+    infected = np.asarray(pyramid_spain) * prevalence / 100.0
+    cum = np.zeros(infected.shape[:-1] + (infected.shape[-1] + 1,))
+    np.cumsum(infected, axis=-1, out=cum[..., 1:])
+    last = len(pyramid_spain) - 1
+    a = np.array([bracket[0] for bracket in brackets])
+    b = np.array([min(bracket[1], last) + 1 for bracket in brackets])
+    return cum[..., b] - cum[..., a]
+
 def get_infected(bracket):
     '''Returns number of infected people in the given age bracket.'''
-    i = 0
-    for age in range(bracket[0], bracket[1] + 1):
-        for (bracket2, percentage) in prevalence_by_age.items():
-            if age >= bracket2[0] and age <= bracket2[1] and age < len(pyramid_spain):
-                i += pyramid_spain[age] * percentage / 100.0
-    return i
-
-ifrs = {}
-for (bracket, deaths) in deaths_by_age.items():
-    infected = get_infected(bracket)
-    ifr = 100.0 * deaths / infected
-    print('Ages {:2} to {:3}: {:7} infected, {:5} deaths, {:6.3f}% IFR'.format(
-        bracket[0], bracket[1], round(infected), round(deaths), ifr))
-    if bracket != (0,199):
-        ifrs[bracket] = ifr
-print('True IFR may be higher due to right-censoring and under-reporting of deaths')
+    return float(infected_by_bracket([bracket])[0])
+
+def redistribute_deaths(deaths=None):
+    '''Scales the deaths by age bracket (default: deaths_by_age) so that they add
+    up to total_deaths.'''
+    if deaths is None:
+        deaths = list(deaths_by_age.values())
+    deaths = np.asarray(deaths, dtype=float)
+    return deaths * (total_deaths / deaths.sum(axis=-1, keepdims=True))
+
+def calc_ifrs(prevalence=None, deaths=None):
+    '''Returns the IFR (in %) of each bracket of deaths_by_age, followed by the
+    overall IFR, as an array whose leading axes are those of <prevalence> (see
+    infected_by_bracket) and <deaths> (number of deaths in each bracket of
+    deaths_by_age, after redistribution of the deaths with unknown age).'''
+    if deaths is None:
+        deaths = redistribute_deaths()
+    brackets = list(deaths_by_age) + [(0,199)]
+    infected = infected_by_bracket(brackets, prevalence)
+    deaths = np.concatenate((deaths, deaths.sum(axis=-1, keepdims=True)), axis=-1)
+    return 100.0 * deaths / infected
+
+def bootstrap(replicates, seed=0):
+    '''Returns a replicates × (len(deaths_by_age) + 1) array of IFRs (same layout
+    as calc_ifrs) where, in each replicate:
+    - the prevalence of each bracket is resampled from a binomial distribution,
+      assuming the participants are distributed among brackets like the
+      population of Spain (the per-bracket sample sizes are not published)
+    - the deaths with unknown age are redistributed among brackets by
+      multinomial sampling, with probabilities proportional to the deaths with
+      known age'''
+    instrument.count('bootstrap replicates', replicates)
+    rng = np.random.default_rng(seed)
+    # participants in each bracket of prevalence_by_age
+    pop = infected_by_bracket(list(prevalence_by_age), np.full(len(pyramid_spain), 100.0))
+    n = np.maximum(np.round(participants * pop / pop.sum()), 1).astype(int)
+    p = np.array(list(prevalence_by_age.values())) / 100.0
+    prevalence = 100.0 * rng.binomial(n, p, size=(replicates, len(n))) / n
+    known = np.array(list(deaths_by_age.values()))
+    unknown = rng.multinomial(total_deaths - known.sum(), known / known.sum(),
+            size=replicates)
+    return calc_ifrs(prevalence_vector(prevalence), known + unknown)
+
+def format_line(bracket, infected, deaths, ifr):
+    return 'Ages {:2} to {:3}: {:7} infected, {:5} deaths, {:6.3f}% IFR'.format(
+        bracket[0], bracket[1], round(infected), round(deaths), ifr)
+
+def add_arguments(parser):
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+            help='also show 95%% confidence intervals from N bootstrap replicates')
+    parser.add_argument('--seed', type=int, default=0,
+            help='random seed for --bootstrap (default: %(default)s)')
+    parser.add_argument('--surveys', metavar='FILE',
+            help='instead of the Spanish serosurvey, calculate the IFR of every '
+            'serosurvey of FILE (see serosurveys.py)')
+
+def run(args):
+    if args.surveys:
+        if args.bootstrap:
+            sys.exit('--bootstrap is not supported with --surveys')
+        import serosurveys
+        serosurveys.run(args.surveys)
+        return
+    brackets = list(deaths_by_age) + [(0,199)]
+    with instrument.span('calc_ifr.calc_ifrs'):
+        deaths = redistribute_deaths()
+        deaths = np.append(deaths, deaths.sum())
+        infected = infected_by_bracket(brackets)
+        ifrs = calc_ifrs()
+    if args.bootstrap:
+        with instrument.span('calc_ifr.bootstrap'):
+            (lo, hi) = np.percentile(bootstrap(args.bootstrap, args.seed), (2.5, 97.5), axis=0)
+    for (i, bracket) in enumerate(brackets):
+        line = format_line(bracket, infected[i], deaths[i], ifrs[i])
+        if args.bootstrap:
+            line += ' (95% CI: {:6.3f}-{:6.3f})'.format(lo[i], hi[i])
+        print(line)
+    print('True IFR may be higher due to right-censoring and under-reporting of deaths')
+
+def main():
+    parser = argparse.ArgumentParser(description='Calculate the age-stratified '
+            'IFR based on the second round of the Spanish ENE-COVID serosurvey.')
+    add_arguments(parser)
+    run(parser.parse_args())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+#
+# Calculate the overall IFRs of arbitrarily many custom population pyramids
+# (subnational, synthetic...) read from a CSV or Parquet file, with constant
+# memory: pyramids are streamed in fixed-size chunks through a process pool
+# (shared_executor.py), and the results are written as soon as they are
+# available. Chunks and their overall IFRs are exchanged with the workers
+# through slots of shared memory, and the compiled IFR models are shared with
+# them, so that only slot numbers go through the pool.
+# Author: Marc Bevand — @zorinaq
+#
+# The input file has one row per pyramid: a name column, and one column per
+# age group of apply_ifr.age_groups, labelled like in the UN file ('0-4', '5-9',
+# ..., '95-99', '100+') and holding numbers of people. The output is a CSV file
+# with the name and the overall IFR according to each model of apply_ifr.ifrs.
+# Pyramids with a missing, blank or negative number of people get NaN overall
+# IFRs, and are reported on the standard error.
+
+import argparse
+import csv
+import os
+import sys
+import numpy as np
+import apply_ifr
+import shared_executor
+from shared_executor import SharedExecutor
+
+def read_chunks(path, chunk_size, name_column):
+    # Yields (<names>, <rows × age_groups array of people>) for each chunk of
+    # <chunk_size> pyramids of <path>
+    columns = [apply_ifr.ag2str(ag) for ag in apply_ifr.age_groups]
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit('pyarrow is required to read Parquet files')
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size,
+                columns=[name_column] + columns):
+            names = batch.column(name_column).to_pylist()
+            values = np.column_stack([batch.column(c).to_numpy(zero_copy_only=False)
+                for c in columns]).astype(float)
+            yield names, values
+    else:
+        import pandas as pd
+        for df in pd.read_csv(path, chunksize=chunk_size,
+                dtype={name_column: str}, usecols=[name_column] + columns):
+            yield list(df[name_column]), df[columns].to_numpy(dtype=float)
+
+# apply_ifr.prefix_matrices of the shared models, calculated by each worker
+# process for its first chunk
+_brackets = None
+
+def calc_chunk(slot, n):
+    # Calculates the overall IFRs of the <n> pyramids in the slot <slot> of the
+    # shared chunks, written to the same slot of the shared results. Returns the
+    # indices of the invalid pyramids in the chunk.
+    global _brackets
+    arrays = shared_executor.arrays
+    if _brackets is None:
+        _brackets = apply_ifr.prefix_matrices(*apply_ifr.compiled_ifr_matrix(
+            arrays['ifr'][arrays['rows']]))
+    groups = arrays['chunks'][slot, :n]
+    arrays['oifrs'][slot, :n] = apply_ifr.overall_ifr_matrix(groups, apply_ifr.ifrs,
+            brackets=_brackets)
+    return np.flatnonzero(apply_ifr.invalid_pyramids(groups)).tolist()
+
+def calc_file(path, output, chunk_size=10_000, workers=None, name_column='Name'):
+    # Returns the number of pyramids processed, the number of invalid ones, and
+    # the SharedExecutor that calculated them. At most 2 chunks per worker are
+    # in flight at any time, each in its own slot, and results are written in
+    # the input order.
+    workers = workers or os.cpu_count()
+    nslots = 2 * workers
+    shared = {
+            'chunks': np.zeros((nslots, chunk_size, len(apply_ifr.age_groups))),
+            'oifrs': np.zeros((nslots, chunk_size, len(apply_ifr.ifrs))),
+            'ifr': apply_ifr.registry.ifr,
+            'rows': np.array(apply_ifr.registry_rows(apply_ifr.ifrs), dtype=np.int64),
+    }
+    (n, ninvalid) = (0, 0)
+    with open(output, 'w', newline='', encoding='utf-8') as f, \
+            SharedExecutor(shared, workers) as executor:
+        (chunks, oifrs) = (executor.arrays['chunks'], executor.arrays['oifrs'])
+        writer = csv.writer(f)
+        writer.writerow([name_column] + [name for (name, _) in apply_ifr.ifrs])
+        pending = []
+        reader = read_chunks(path, chunk_size, name_column)
+        # chunks are submitted and written in order, so the slot of a chunk is
+        # free once the chunk submitted nslots chunks before it is written
+        submitted = 0
+        while True:
+            while len(pending) < nslots:
+                chunk = next(reader, None)
+                if chunk is None:
+                    break
+                (names, groups) = chunk
+                slot = submitted % nslots
+                chunks[slot, :len(names)] = groups
+                pending.append((names, slot, executor.submit(calc_chunk, slot,
+                    len(names), units=len(names))))
+                submitted += 1
+            if not pending:
+                break
+            (names, slot, future) = pending.pop(0)
+            invalid = future.result()
+            writer.writerows([name, *row] for (name, row) in
+                    zip(names, oifrs[slot, :len(names)].tolist()))
+            for i in invalid:
+                print(f'{names[i]}: missing or negative number of people, overall '
+                        'IFRs set to NaN', file=sys.stderr)
+            n += len(names)
+            ninvalid += len(invalid)
+    return n, ninvalid, executor
+
+def main():
+    parser = argparse.ArgumentParser(description='Calculate the overall IFRs of '
+            'custom population pyramids read from a CSV or Parquet file.')
+    parser.add_argument('input', help='CSV or Parquet (.parquet) file of pyramids')
+    parser.add_argument('output', help='CSV file of overall IFRs')
+    parser.add_argument('--name-column', default='Name',
+            help='column holding the names of the pyramids (default: %(default)s)')
+    parser.add_argument('--chunk-size', type=apply_ifr.positive_int, default=10_000,
+            help='pyramids per chunk (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+            help='number of worker processes (default: %(default)s)')
+    args = parser.parse_args()
+    (n, ninvalid, executor) = calc_file(args.input, args.output, args.chunk_size,
+            args.workers, args.name_column)
+    print(f'{n} pyramids processed' + (f', {ninvalid} invalid' if ninvalid else ''))
+    if n:
+        shared_executor.show_throughput(executor, 'pyramids')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Output of overall IFR tables: sorting, and writing them in one buffered write
+# as text (like apply_ifr.py), Markdown (like README.md), CSV, JSON lines,
+# Parquet or Arrow IPC.
+# Author: Marc Bevand — @zorinaq
+#
+# A table is given as <regions> (list of names), <models> (list of names) and
+# <values> (regions × models array of overall IFRs, in %).
+
+import csv
+import io
+import json
+import math
+import sys
+import numpy as np
+
+formats = ('text', 'markdown', 'csv', 'jsonl', 'parquet', 'arrow')
+
+# Formats written as bytes, to a file only
+binary_formats = ('parquet', 'arrow')
+
+def sort_table(regions, models, values, key=None, reverse=True):
+    # Sorts the rows by the model named <key> (default: the first model), or by
+    # region name if <key> is 'Region'. Ties keep their original order.
+    values = np.asarray(values)
+    if key not in (None, 'Region') and key not in models:
+        raise ValueError(f'unknown sort column: {key}')
+    if key == 'Region':
+        order = sorted(range(len(regions)), key=lambda i: regions[i], reverse=reverse)
+    else:
+        col = values[:, models.index(key) if key is not None else 0]
+        order = np.lexsort((np.arange(len(regions)), -col if reverse else col))
+    return [regions[i] for i in order], values[order]
+
+def format_text(regions, models, values, precision=3, markdown=False):
+    def header():
+        return ''.join(f'| {m:>13} ' for m in models) + '| Region |\n'
+    lines = [header()]
+    if markdown:
+        lines.append('| ------------- ' * len(models) + '| ------ |\n')
+    for (region, row) in zip(regions, values.tolist()):
+        lines.append(''.join(f'| {x:13.{precision}f} ' for x in row) + f'| {region} |\n')
+    if not markdown:
+        lines.append(header())
+    return ''.join(lines)
+
+def format_csv(regions, models, values):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(['Region'] + models)
+    # repr of floats is the shortest string that round-trips: full precision
+    writer.writerows([region] + [repr(x) for x in row]
+            for (region, row) in zip(regions, values.tolist()))
+    return out.getvalue()
+
+def json_value(x):
+    # JSON has no NaN or infinity: non-finite IFRs (such as those of invalid
+    # pyramids) are written as null
+    return x if math.isfinite(x) else None
+
+def format_jsonl(regions, models, values):
+    return ''.join(json.dumps({'Region': region, **{m: json_value(x) for (m, x) in
+        zip(models, row)}}, ensure_ascii=False, allow_nan=False) + '\n'
+        for (region, row) in zip(regions, values.tolist()))
+
+def arrow_table(regions, models, values):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        sys.exit('pyarrow is required to write Parquet and Arrow files')
+    # one copy to make each model's column contiguous, then pa.array wraps the
+    # buffers without copying
+    columns = np.ascontiguousarray(np.asarray(values, dtype=float).T)
+    return pa.table([pa.array(regions)] + [pa.array(c) for c in columns],
+            names=['Region'] + list(models))
+
+def write_table(regions, models, values, fmt='text', path=None, precision=3):
+    # Writes the table to <path> (default: standard output, for text formats)
+    values = np.asarray(values, dtype=float)
+    if fmt in binary_formats:
+        if path is None:
+            sys.exit(f'{fmt} output requires an output file')
+        table = arrow_table(regions, models, values)
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, path)
+        else:
+            import pyarrow as pa
+            with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as w:
+                w.write_table(table)
+        return
+    if fmt in ('text', 'markdown'):
+        data = format_text(regions, models, values, precision, fmt == 'markdown')
+    elif fmt == 'csv':
+        data = format_csv(regions, models, values)
+    elif fmt == 'jsonl':
+        data = format_jsonl(regions, models, values)
+    else:
+        raise ValueError(f'unknown format: {fmt}')
+    if path is None:
+        sys.stdout.write(data)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(data)
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+#
+# Command-line entry point for all the calculations of this project:
+#   ifr.py table   overall IFR of countries (apply_ifr.py)
+#   ifr.py plot    chart of COVID-19 vs. seasonal influenza (covid_vs_flu.py)
+#   ifr.py calc    age-stratified IFR from the ENE-COVID serosurvey (calc_ifr.py)
+# Author: Marc Bevand — @zorinaq
+#
+# Only the module of the requested subcommand is imported, and the modules
+# themselves import heavy libraries (pandas, matplotlib) only on the code paths
+# needing them, to keep the startup time low. See benchmarks/startup.py.
+
+import argparse
+import importlib
+import sys
+import instrument
+
+# subcommand: (module, help)
+commands = {
+        'table': ('apply_ifr', 'calculate the overall IFR of countries'),
+        'plot': ('covid_vs_flu', 'plot the IFR of COVID-19 vs. seasonal influenza'),
+        'calc': ('calc_ifr', 'calculate the age-stratified IFR from ENE-COVID'),
+}
+
+def add_global_arguments(parser):
+    # Arguments preceding the subcommand
+    parser.add_argument('--profile', metavar='FILE',
+            help='time each stage of the calculation, write a JSON report to '
+            'FILE and a summary to stderr')
+    parser.add_argument('--no-trace-memory', action='store_true',
+            help='with --profile, do not trace Python memory allocations')
+
+def find_command(argv):
+    # Returns the subcommand of <argv>, or None: the first argument that is not
+    # an option or the value of one (such as the FILE of --profile FILE)
+    parser = argparse.ArgumentParser(add_help=False, exit_on_error=False)
+    add_global_arguments(parser)
+    parser.add_argument('command', nargs='?')
+    try:
+        (args, _) = parser.parse_known_args(argv)
+    except argparse.ArgumentError:
+        # reported by the full parser
+        return None
+    return args.command if args.command in commands else None
+
+def build_parser(command=None):
+    # The arguments of a subcommand are defined by its module, so they are only
+    # added for <command>, the subcommand being run
+    parser = argparse.ArgumentParser(description='Age-stratified IFR of COVID-19.')
+    add_global_arguments(parser)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for (name, (module, help)) in commands.items():
+        sub = subparsers.add_parser(name, help=help, description=help)
+        if name == command:
+            importlib.import_module(module).add_arguments(sub)
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser(find_command(argv)).parse_args(argv)
+    if args.profile:
+        instrument.enable(trace_memory=not args.no_trace_memory)
+    with instrument.span(f'ifr.py {args.command}'):
+        module = importlib.import_module(commands[args.command][0])
+        module.run(args)
+    if args.profile:
+        instrument.write_report(args.profile)
+        instrument.summary()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+#
+# Compile the registry of IFR estimates (ifr_models.py) into a binary artifact,
+# and load it.
+# Author: Marc Bevand — @zorinaq
+#
+# The artifact is a .npz file in cache_dir, keyed by the hash of ifr_models.py
+# and the version of its layout,
+# holding for every model its name, its kind ('covid' or 'flu'), its IFR at
+# every single year of age from 0 to maxage (NaN at the ages it does not cover),
+# its age groups and their IFRs, the 95% intervals of ifr_models.intervals, and
+# its IFR at every age for each sex (ifr_models.by_sex, or the same IFR for both
+# sexes).
+# Loading it is a single read, however many models are registered; ifr_models.py
+# is only executed when it changed since the artifact was compiled.
+
+import hashlib
+import os
+import types
+import numpy as np
+
+file_models = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ifr_models.py')
+
+cache_dir = '.cache'
+
+# Version of the layout of the artifact, part of its file name: bump it whenever
+# compile_registry or Registry change, so that older artifacts are not loaded
+version = 2
+
+kinds = ('covid', 'flu')
+
+# Sexes of the by-sex IFRs, in the order of the axis of Registry.ifr_sex
+sexes = ('male', 'female')
+
+def validate(name, ifr_age_stratified, maxage):
+    # Raises ValueError unless the age groups of the model are consecutive (no
+    # gap, no overlap) and end at maxage. Models may start after age 0: they
+    # have no IFR at younger ages.
+    groups = sorted(ifr_age_stratified)
+    if not groups:
+        raise ValueError(f'{name}: no age groups')
+    for (a, b) in groups:
+        if not (isinstance(a, int) and isinstance(b, int) and 0 <= a <= b <= maxage):
+            raise ValueError(f'{name}: invalid age group {(a, b)}')
+        ifr = ifr_age_stratified[(a, b)]
+        if not (np.isfinite(ifr) and ifr >= 0):
+            raise ValueError(f'{name}: invalid IFR {ifr} for age group {(a, b)}')
+    for ((_, b1), (a2, b2)) in zip(groups, groups[1:]):
+        if a2 <= b1:
+            raise ValueError(f'{name}: age group {(a2, b2)} overlaps the previous one')
+        if a2 > b1 + 1:
+            raise ValueError(f'{name}: gap between ages {b1} and {a2}')
+    if groups[-1][1] != maxage:
+        raise ValueError(f'{name}: the last age group does not end at {maxage}')
+
+def read_models(source):
+    # Executes <source>, the content of ifr_models.py, and returns its namespace.
+    # Models are compiled from the very source whose hash keys the artifact, not
+    # from an imported ifr_models module, which may predate an edit of the file.
+    namespace = {}
+    exec(compile(source, file_models, 'exec'), namespace)
+    return types.SimpleNamespace(**namespace)
+
+def compile_registry(path, source):
+    # Validates the models of <source> (see read_models) and writes them to <path>
+    ifr_models = read_models(source)
+    maxage = ifr_models.maxage
+    models = [(name, kind, m) for kind in kinds
+            for (name, m) in getattr(ifr_models, kind)]
+    names = [name for (name, _, _) in models]
+    if len(set(names)) != len(names):
+        raise ValueError('duplicate model names')
+    ifr = np.full((len(models), maxage + 1), np.nan)
+    groups, values = [], []
+    for (i, (name, _, m)) in enumerate(models):
+        validate(name, m, maxage)
+        for ((a, b), val) in sorted(m.items()):
+            ifr[i, a:b + 1] = val
+            groups.append((i, a, b))
+            values.append(val)
+    intervals, bounds = [], []
+    for (name, model_intervals) in ifr_models.intervals.items():
+        if name not in names:
+            raise ValueError(f'intervals of unknown model: {name}')
+        i = names.index(name)
+        for ((a, b), (lo, hi)) in sorted(model_intervals.items()):
+            if (a, b) not in models[i][2]:
+                raise ValueError(f'{name}: interval of unknown age group {(a, b)}')
+            if not lo <= models[i][2][(a, b)] <= hi:
+                raise ValueError(f'{name}: IFR of age group {(a, b)} outside of its interval')
+            intervals.append((i, a, b))
+            bounds.append((lo, hi))
+    # sex-agnostic models have the same IFR for both sexes
+    ifr_sex = np.repeat(ifr[:, None, :], len(sexes), axis=1)
+    for (name, model_by_sex) in ifr_models.by_sex.items():
+        if name not in names:
+            raise ValueError(f'IFRs by sex of unknown model: {name}')
+        if sorted(model_by_sex) != sorted(sexes):
+            raise ValueError(f'{name}: IFRs by sex must be given for {" and ".join(sexes)}')
+        i = names.index(name)
+        for (s, sex) in enumerate(sexes):
+            m = model_by_sex[sex]
+            validate(f'{name} ({sex})', m, maxage)
+            if min(m)[0] != min(models[i][2])[0]:
+                raise ValueError(f'{name} ({sex}): does not cover the same ages as the model')
+            for ((a, b), val) in m.items():
+                ifr_sex[i, s, a:b + 1] = val
+    # write to a temporary file first so concurrent runs never see a partial file
+    tmp = f'{path}.tmp{os.getpid()}.npz'
+    np.savez(tmp, maxage=maxage, cdc_sympt=ifr_models.cdc_sympt,
+            names=np.array(names), kinds=np.array([kind for (_, kind, _) in models]),
+            ifr=ifr, groups=np.array(groups, dtype=np.int64).reshape(-1, 3),
+            values=np.array(values), intervals=np.array(intervals,
+                dtype=np.int64).reshape(-1, 3), bounds=np.array(bounds).reshape(-1, 2),
+            ifr_sex=ifr_sex)
+    os.replace(tmp, path)
+
+def key(ifr_age_stratified):
+    # Hashable content of a model: the same for two dicts with the same age
+    # groups and IFRs
+    return tuple(sorted(ifr_age_stratified.items()))
+
+class Registry:
+    # Models loaded from a compiled registry. Each model is available as a tuple
+    # (<name>, {<age group>: <IFR>}), the layout used by all the scripts, as a
+    # row of the models × ages array <ifr>, and as a row of the models × sexes ×
+    # ages array <ifr_sex>.
+    def __init__(self, data):
+        self.maxage = int(data['maxage'])
+        self.cdc_sympt = float(data['cdc_sympt'])
+        self.names = data['names'].tolist()
+        self.kinds = data['kinds'].tolist()
+        self.ifr = data['ifr']
+        self.ifr_sex = data['ifr_sex']
+        self.index = {name: i for (i, name) in enumerate(self.names)}
+        dicts = [{} for _ in self.names]
+        for ((i, a, b), val) in zip(data['groups'].tolist(), data['values'].tolist()):
+            dicts[i][(a, b)] = val
+        self.models = [(name, m) for (name, m) in zip(self.names, dicts)]
+        self.intervals = {}
+        for ((i, a, b), bounds) in zip(data['intervals'].tolist(), data['bounds'].tolist()):
+            self.intervals.setdefault(self.names[i], {})[(a, b)] = tuple(bounds)
+        # content of each model (see key), to tell if a dict was edited since
+        self.keys = [key(m) for m in dicts]
+        # names of the models by the labels given to them by select
+        self.aliases = {}
+
+    def of_kind(self, kind):
+        return [model for (model, k) in zip(self.models, self.kinds) if k == kind]
+
+    def select(self, labels):
+        # <labels>: {<label>: <model name>}. Returns the models in the order of
+        # <labels>, renamed to their labels.
+        self.aliases.update(labels)
+        return [(label, self.models[self.index[name]][1]) for (label, name) in labels.items()]
+
+    def row(self, name, ifr_age_stratified):
+        # Returns the row of the model named (or labelled, see select) <name>, or
+        # None if there is no such model or if its age groups and IFRs differ
+        # from <ifr_age_stratified> (for example a model edited in place)
+        i = self.index.get(self.aliases.get(name, name))
+        if i is None or self.keys[i] != key(ifr_age_stratified):
+            return None
+        return i
+
+    def vector(self, name, ifr_age_stratified):
+        # Returns the IFR at ages 0 to maxage of a model of the registry (see
+        # row), or None
+        i = self.row(name, ifr_age_stratified)
+        return None if i is None else self.ifr[i]
+
+    def sex_vectors(self, name, ifr_age_stratified):
+        # Same as vector, for each sex: returns a sexes × ages array, or None
+        i = self.row(name, ifr_age_stratified)
+        return None if i is None else self.ifr_sex[i]
+
+def load():
+    # Returns the Registry, compiling it first if ifr_models.py changed
+    with open(file_models, 'rb') as f:
+        source = f.read()
+    h = hashlib.sha1(source).hexdigest()
+    path = os.path.join(cache_dir, f'ifr-models-v{version}-{h}.npz')
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        compile_registry(path, source)
+    with np.load(path) as data:
+        return Registry(data)
+
+if __name__ == '__main__':
+    registry = load()
+    print(f'{len(registry.names)} models compiled: '
+            + ', '.join(f'{registry.kinds.count(k)} {k}' for k in kinds))
@@ -0,0 +1,99 @@
+# Lightweight instrumentation of the calculations: named spans measuring wall
+# time, CPU time and memory, and named counters. Disabled by default: span()
+# then returns a shared no-op context manager and count() returns immediately.
+# Author: Marc Bevand — @zorinaq
+#
+# Usage:
+#   with instrument.span('apply_ifr.read_csv'):
+#       ...
+#   instrument.count('regions parsed', len(regions))
+
+import contextlib
+import json
+import resource
+import sys
+import time
+
+enabled = False
+
+# span name: {'calls', 'wall', 'cpu', 'peak_rss', 'peak_traced'}
+spans = {}
+# counter name: value
+counters = {}
+
+_noop = contextlib.nullcontext()
+# spans currently open, innermost last
+_stack = []
+_tracemalloc = None
+
+def enable(trace_memory=True):
+    # Starts recording. With <trace_memory>, the peak memory allocated by Python
+    # inside each span is also measured (this slows down allocations).
+    global enabled, _tracemalloc
+    enabled = True
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+        _tracemalloc = tracemalloc
+
+def _update_traced_peaks():
+    # Credits the peak since the last reset to all open spans
+    if _tracemalloc:
+        peak = _tracemalloc.get_traced_memory()[1]
+        for s in _stack:
+            s.peak_traced = max(s.peak_traced, peak)
+        _tracemalloc.reset_peak()
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.peak_traced = 0
+
+    def __enter__(self):
+        _update_traced_peaks()
+        _stack.append(self)
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        _update_traced_peaks()
+        _stack.pop()
+        stats = spans.setdefault(self.name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+            'peak_rss': 0, 'peak_traced': 0})
+        stats['calls'] += 1
+        stats['wall'] += wall
+        stats['cpu'] += cpu
+        # ru_maxrss is the high-water mark of the process, in kB on Linux
+        stats['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        stats['peak_traced'] = max(stats['peak_traced'], self.peak_traced)
+        return False
+
+def span(name):
+    if not enabled:
+        return _noop
+    return Span(name)
+
+def count(name, n=1):
+    if not enabled:
+        return
+    counters[name] = counters.get(name, 0) + n
+
+def report():
+    return {'spans': spans, 'counters': counters}
+
+def write_report(path):
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=1)
+
+def summary(file=sys.stderr):
+    print(f'| {"Span":<32} | {"Calls":>6} | {"Wall (s)":>9} | {"CPU (s)":>9} '
+            f'| {"Peak RSS (MB)":>13} | {"Peak traced (MB)":>16} |', file=file)
+    for (name, s) in spans.items():
+        print(f'| {name:<32} | {s["calls"]:6} | {s["wall"]:9.4f} | {s["cpu"]:9.4f} '
+                f'| {s["peak_rss"] / 2**20:13.1f} | {s["peak_traced"] / 2**20:16.1f} |',
+                file=file)
+    for (name, n) in counters.items():
+        print(f'{name}: {n}', file=file)
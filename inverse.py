@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+#
+# Infer the infections and attack rates implied by observed deaths, according
+# to every IFR model of apply_ifr.py: the inverse of apply_ifr.py.
+# Author: Marc Bevand — @zorinaq
+#
+# Observed deaths are read from a CSV file with one row per region (named like
+# in the UN file of apply_ifr.py), a 'Deaths' column holding the total number
+# of deaths, and optionally one column per age bracket of deaths, labelled
+# '<first age>-<last age>' or '<first age>+' (see observed_deaths.csv). Cells
+# may be left empty.
+#
+# - Regions with the total only are assumed to have the same attack rate at
+#   all ages: it is the total over the deaths expected if everybody got
+#   infected.
+# - Regions with deaths by age get an attack rate for each age bracket of the
+#   profile (default: the brackets of the file), fitted by least squares to the
+#   deaths of all their brackets, weighted like Poisson counts. Like in
+#   calc_ifr.py, the deaths with unknown age (total minus the sum of brackets)
+#   are distributed proportionally among brackets. The brackets of the profile
+#   must be disjoint and cover all ages, those of the file must be disjoint.
+# The fits of all regions and models are solved at once, as a stack of
+# pseudo-inverses. The fit is not constrained: attack rates below 0 or above 1,
+# which mean that the deaths are inconsistent with a model, are reported.
+
+import argparse
+import csv
+import sys
+import numpy as np
+import apply_ifr
+import export_ifr
+
+def parse_bracket(label):
+    try:
+        if label.endswith('+'):
+            (a, b) = (int(label[:-1]), apply_ifr.maxage)
+        else:
+            (a, b) = (int(x) for x in label.split('-'))
+    except ValueError:
+        raise ValueError(f'invalid age bracket: {label}') from None
+    if not 0 <= a <= b:
+        raise ValueError(f'invalid age bracket: {label}')
+    return a, min(b, apply_ifr.maxage)
+
+def check_brackets(brackets, complete=False):
+    # Raises ValueError if <brackets> overlap or, if <complete>, do not cover
+    # ages 0 to maxage
+    brackets = sorted(brackets)
+    for ((a1, b1), (a2, b2)) in zip(brackets, brackets[1:]):
+        if a2 <= b1:
+            raise ValueError(f'age brackets {ag_label(a1, b1)} and {ag_label(a2, b2)} overlap')
+        if complete and a2 > b1 + 1:
+            raise ValueError(f'no age bracket for ages {b1 + 1} to {a2 - 1}')
+    if complete and (not brackets or brackets[0][0] > 0 or brackets[-1][1] < apply_ifr.maxage):
+        raise ValueError(f'the age brackets must cover ages 0 to {apply_ifr.maxage}')
+
+def ag_label(a, b):
+    return apply_ifr.ag2str((a, b))
+
+def read_deaths(path):
+    # Returns the regions, their total deaths, the age brackets, and a regions ×
+    # brackets array of deaths (NaN where unknown). Raises ValueError if the
+    # file is invalid.
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    columns = [i for (i, c) in enumerate(header) if c not in ('Region', 'Deaths')]
+    brackets = []
+    for i in columns:
+        try:
+            brackets.append(parse_bracket(header[i]))
+        except ValueError:
+            raise ValueError(f'{path}: invalid column {header[i]!r}, expected an age '
+                    "bracket such as '0-9' or '90+'") from None
+    check_brackets(brackets)
+    regions = [row[header.index('Region')] for row in rows]
+    def cell(x):
+        return float(x) if x.strip() else np.nan
+    totals = np.array([cell(row[header.index('Deaths')]) for row in rows])
+    deaths = np.array([[cell(row[i]) for i in columns] for row in rows]).reshape(len(rows), -1)
+    for (region, total, row) in zip(regions, totals, deaths):
+        known = row[~np.isnan(row)]
+        if len(known) and not known.sum() and total > 0:
+            raise ValueError(f'{region}: {total:g} deaths but none in the age '
+                    'brackets, leave them empty if unknown')
+    return regions, totals, brackets, deaths
+
+def membership(brackets):
+    # Returns a brackets × single-year-ages matrix: 1 where an age is in a bracket
+    ages = np.arange(apply_ifr.maxage + 1)
+    return np.array([(ages >= a) & (ages <= b) for (a, b) in brackets],
+            dtype=float).reshape(len(brackets), len(ages))
+
+def solve(people, ifr, totals, brackets, deaths, profile):
+    # Returns two regions × models arrays, the implied infections and overall
+    # attack rate, and a regions × models × profile array of attack rates (NaN for
+    # the regions without deaths by age, and the profile brackets not covered by
+    # any observed bracket, in which case the infections are unknown too)
+    # expected deaths per single year of age if everybody got infected
+    full = people[:, :, None] * ifr[None] / 100.0
+    pop = people.sum(axis=1)
+    # uniform attack rate from the total
+    uniform = totals[:, None] / full.sum(axis=1)
+    infections = uniform * pop[:, None]
+    rates = np.full(infections.shape + (len(profile),), np.nan)
+    known = ~np.isnan(deaths)
+    stratified = known.any(axis=1) & (len(brackets) > 0)
+    if stratified.any():
+        # distribute the deaths with unknown age proportionally among brackets
+        observed = np.where(known, deaths, 0)[stratified]
+        total = observed.sum(axis=1)
+        scale = np.where(np.isnan(totals[stratified]) | (total == 0), 1,
+                totals[stratified] / np.where(total == 0, 1, total))
+        observed = observed * scale[:, None]
+        # A[r, m, b, p]: deaths in bracket b if everybody in profile bracket p got
+        # infected, and nobody else
+        (in_bracket, in_profile) = (membership(brackets), membership(profile))
+        A = np.einsum('ba,pa,ram->rmbp', in_bracket, in_profile, full[stratified])
+        # Poisson weights; unknown brackets get a weight of zero
+        w = np.where(known[stratified], 1 / np.sqrt(np.maximum(observed, 1)), 0)
+        Aw = A * w[:, None, :, None]
+        x = np.linalg.pinv(Aw) @ (observed * w)[:, None, :, None]
+        x = x[..., 0]
+        # profile brackets that no observed bracket constrains
+        free = ~(np.abs(Aw) > 0).any(axis=2)
+        x[free] = np.nan
+        rates[stratified] = x
+        people_profile = people[stratified] @ in_profile.T
+        infections[stratified] = (x * people_profile[:, None, :]).sum(axis=2)
+    return infections, infections / pop[:, None], rates
+
+def implausible(regions, models, profile, attack, rates):
+    # Returns a description of the attack rates below 0 or above 1
+    out = []
+    for (i, j) in zip(*np.nonzero((attack < 0) | (attack > 1))):
+        out.append(f'{regions[i]}, {models[j]}: attack rate {100 * attack[i, j]:.3f}%')
+    for (i, j, k) in zip(*np.nonzero((rates < 0) | (rates > 1))):
+        out.append(f'{regions[i]}, {models[j]}, ages {ag_label(*profile[k])}: '
+                f'attack rate {100 * rates[i, j, k]:.3f}%')
+    return out
+
+def write_csv(path, regions, models, profile, infections, attack, rates):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Region', 'Model', 'Infections', 'Attack rate'] +
+                [f'Attack rate {apply_ifr.ag2str(p)}' for p in profile])
+        for (i, region) in enumerate(regions):
+            for (j, model) in enumerate(models):
+                writer.writerow([region, model, repr(float(infections[i, j])),
+                    repr(float(attack[i, j]))] + [repr(x) for x in rates[i, j].tolist()])
+
+def main():
+    parser = argparse.ArgumentParser(description='Infer the infections and attack '
+            'rates implied by observed deaths, according to each IFR model.')
+    parser.add_argument('deaths', help='CSV file of observed deaths by region')
+    parser.add_argument('--profile', nargs='+', metavar='BRACKET',
+            help='age brackets of the fitted attack rates, eg. 0-49 50-69 70+ '
+            '(default: the brackets of the deaths)')
+    parser.add_argument('--year', type=int, default=2020,
+            help='reference year of the pyramids (default: %(default)s)')
+    parser.add_argument('--split', choices=apply_ifr.splits, default='uniform',
+            help='how to split 5-year age groups into single years of age '
+            '(default: %(default)s)')
+    parser.add_argument('--output', metavar='FILE',
+            help='also write the infections and attack rates (by profile '
+            'bracket) to the CSV file FILE')
+    args = parser.parse_args()
+    try:
+        (regions, totals, brackets, deaths) = read_deaths(args.deaths)
+    except ValueError as e:
+        sys.exit(str(e))
+    try:
+        profile = [parse_bracket(p) for p in args.profile] if args.profile else brackets
+        check_brackets(profile, complete=True)
+    except ValueError as e:
+        parser.error(f'--profile: {e}' if args.profile else f'{args.deaths}: {e}, '
+                'use --profile')
+    pyramids = apply_ifr.load_all_pyramids(args.year)
+    missing = [r for r in regions if r not in pyramids.index]
+    if missing:
+        sys.exit(f'no pyramid for: {", ".join(missing)}')
+    groups = np.array([pyramids.row(r) for r in regions]).reshape(len(regions), -1)
+    people = apply_ifr.expand_age_groups(groups, args.split)
+    (ifr, _) = apply_ifr.ifr_matrix(apply_ifr.ifrs)
+    (infections, attack, rates) = solve(people, ifr, totals, brackets, deaths, profile)
+    models = [name for (name, _) in apply_ifr.ifrs]
+    print('Implied attack rate (%)')
+    export_ifr.write_table(regions, models, 100 * attack)
+    for line in implausible(regions, models, profile, attack, rates):
+        print(f'warning: {line} (deaths inconsistent with the model)', file=sys.stderr)
+    if args.output:
+        write_csv(args.output, regions, models, profile, infections, attack, rates)
+
+if __name__ == '__main__':
+    main()
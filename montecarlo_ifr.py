@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+#
+# Propagate the uncertainty of the age-stratified IFR estimates used by
+# apply_ifr.py to the overall IFR of countries, by Monte Carlo simulation.
+# Author: Marc Bevand — @zorinaq
+
+import argparse
+import os
+from concurrent.futures import wait, FIRST_COMPLETED
+import numpy as np
+import apply_ifr
+import shared_executor
+from shared_executor import SharedExecutor
+
+# Each age group with a 95% interval in apply_ifr.ifr_intervals is modeled as a
+# log-normal distribution whose median is the point estimate, and whose spread
+# is derived from the width of the interval in log space. Age groups are drawn
+# independently of each other.
+z95 = 1.959963984540054
+
+# Draws of the overall IFR are not kept in memory: they are accumulated in a
+# per-region histogram of log10(IFR in %) with hist_bins bins spanning
+# hist_range, from which the median and 95% interval are read. The relative
+# resolution of the quantiles is 10**(8/8192) - 1, that is 0.2%.
+hist_bins = 8192
+hist_range = (-6.0, 2.0)
+
+# Number of draws in each task handed to the process pool (shared_executor.py),
+# whose workers share the pyramids with this process
+draws_per_task = 1 << 16
+
+def lognormal_params(name, ifr_age_stratified):
+    # Returns the age groups of the model, and the mu and sigma of the log-normal
+    # distribution of each age group (sigma is zero without an interval)
+    intervals = apply_ifr.ifr_intervals.get(name, {})
+    groups = sorted(ifr_age_stratified)
+    # a point estimate of zero gives mu = -inf, and draws that are always zero
+    with np.errstate(divide='ignore'):
+        mu = np.log([ifr_age_stratified[g] for g in groups])
+    sigma = np.zeros(len(groups))
+    for (i, g) in enumerate(groups):
+        if g in intervals:
+            (lo, hi) = intervals[g]
+            sigma[i] = (np.log(hi) - np.log(lo)) / (2 * z95)
+    return groups, mu, sigma
+
+def group_weights(groups, ifr_groups):
+    # Returns a regions × ifr_groups matrix: the fraction of the population of each
+    # region falling in each age group of an IFR model
+    people = apply_ifr.expand_age_groups(groups)
+    weights = np.empty((people.shape[0], len(ifr_groups)))
+    for (j, (a, b)) in enumerate(ifr_groups):
+        weights[:, j] = people[:, a:b + 1].sum(axis=1)
+    return weights / weights.sum(axis=1)[:, None]
+
+# group_weights of the shared pyramids for each model, calculated by each
+# worker process for its first task of the model
+_weights = {}
+
+def run_task(task, batch):
+    # Draws <n> samples of the overall IFR of every region for the model at index
+    # <m>, in batches of <batch> draws, and returns their regions × hist_bins
+    # histogram
+    (m, n, seed, ifr_groups, mu, sigma) = task
+    if m not in _weights:
+        _weights[m] = group_weights(shared_executor.arrays['pyramids'], ifr_groups)
+    weights = _weights[m]
+    rng = np.random.default_rng(seed)
+    nregions = weights.shape[0]
+    hist = np.zeros(nregions * hist_bins, dtype=np.int64)
+    offsets = np.arange(nregions) * hist_bins
+    scale = hist_bins / (hist_range[1] - hist_range[0])
+    while n > 0:
+        k = min(n, batch)
+        # in-place operations: the only temporaries are the samples, and the
+        # overall IFRs and their bins (see batch_size)
+        samples = rng.standard_normal((k, len(mu)))
+        samples *= sigma
+        samples += mu
+        np.exp(samples, out=samples)
+        oifrs = samples @ weights.T
+        np.log10(oifrs, out=oifrs)
+        oifrs -= hist_range[0]
+        oifrs *= scale
+        bins = oifrs.astype(np.int64)
+        del oifrs
+        np.clip(bins, 0, hist_bins - 1, out=bins)
+        bins += offsets
+        hist += np.bincount(bins.ravel(), minlength=hist.size)
+        n -= k
+    return m, hist.reshape(nregions, hist_bins)
+
+def hist_quantiles(hist, qs):
+    # Returns a len(qs) × regions array of quantiles (IFR in %) read from the
+    # regions × hist_bins histograms, interpolating linearly inside a bin
+    cum = np.cumsum(hist, axis=1)
+    total = cum[:, -1:]
+    width = (hist_range[1] - hist_range[0]) / hist_bins
+    out = np.empty((len(qs), hist.shape[0]))
+    for (i, q) in enumerate(qs):
+        target = q * total
+        b = (cum < target).sum(axis=1)
+        below = np.take_along_axis(cum, b[:, None] - 1, axis=1) * (b[:, None] > 0)
+        inbin = np.take_along_axis(hist, b[:, None], axis=1)
+        frac = ((target - below) / np.maximum(inbin, 1))[:, 0]
+        out[i] = 10 ** (hist_range[0] + (b + frac) * width)
+    return out
+
+def hist_bytes(nregions):
+    # Size of the regions × hist_bins histogram of a task
+    return 8 * nregions * hist_bins
+
+def batch_size(memory, nregions, ngroups):
+    # Returns the number of draws of a batch of run_task fitting in <memory> MB:
+    # first the histogram of the task and the histogram of its current batch
+    # (from np.bincount), then, per draw, the samples (8 bytes per age group),
+    # and the overall IFRs and their bins (8 bytes each per region), which are
+    # both alive while the bins are computed. Raises ValueError if <memory> does
+    # not even fit the histograms and a single draw.
+    per_draw = 8 * (ngroups + 2 * nregions)
+    available = memory * 2**20 - 2 * hist_bytes(nregions)
+    if available < per_draw:
+        raise ValueError(f'the memory budget must be at least '
+                f'{-(-(2 * hist_bytes(nregions) + per_draw) // 2**20)} MB for '
+                f'{nregions} regions')
+    return available // per_draw
+
+def max_pending(memory, nregions, workers):
+    # Returns the number of tasks kept in flight: at most 2 per worker, and as
+    # many as fit in <memory> MB of histograms in the parent process, which
+    # holds the histograms of the finished tasks not summed yet, and a sum for
+    # each model of the tasks in flight
+    return max(1, min(2 * workers, memory * 2**20 // (2 * hist_bytes(nregions))))
+
+def calc_overall_ifr_intervals(draws, seed=0, workers=None, memory=256):
+    # Returns (regions, results) where results[m] is a 3 × regions array holding
+    # the median, 2.5th and 97.5th percentiles of the overall IFR of every region
+    # according to the model apply_ifr.ifrs[m]. Models without any interval are
+    # not simulated: their three rows are the point estimate. Each worker, and
+    # the parent process, use at most <memory> MB for the samples and the
+    # histograms (see batch_size and max_pending), and the results only depend
+    # on <seed>, not on the number of workers.
+    (regions, groups) = (apply_ifr.pyramids.regions, apply_ifr.pyramids.values)
+    point = apply_ifr.overall_ifr_matrix(groups, apply_ifr.ifrs)
+    tasks = []
+    for (m, (name, ifr_age_stratified)) in enumerate(apply_ifr.ifrs):
+        (ifr_groups, mu, sigma) = lognormal_params(name, ifr_age_stratified)
+        if not sigma.any():
+            continue
+        for (i, start) in enumerate(range(0, draws, draws_per_task)):
+            n = min(draws_per_task, draws - start)
+            tasks.append((m, n, np.random.SeedSequence(seed, spawn_key=(m, i)),
+                ifr_groups, mu, sigma))
+    batch = batch_size(memory, len(regions), max(len(m) for (_, m) in apply_ifr.ifrs))
+    workers = workers or os.cpu_count()
+    # tasks are submitted model after model: the histogram of a model is turned
+    # into quantiles, and freed, as soon as all its tasks are done
+    remaining = {}
+    for (m, *_) in tasks:
+        remaining[m] = remaining.get(m, 0) + 1
+    (hists, results) = ({}, {})
+    in_flight = max_pending(memory, len(regions), workers)
+    with SharedExecutor({'pyramids': groups}, workers) as executor:
+        (todo, pending) = (iter(tasks), set())
+        while True:
+            while len(pending) < in_flight:
+                task = next(todo, None)
+                if task is None:
+                    break
+                pending.add(executor.submit(run_task, task, batch, units=task[1]))
+            if not pending:
+                break
+            (finished, pending) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                (m, hist) = future.result()
+                if m in hists:
+                    hists[m] += hist
+                else:
+                    hists[m] = hist
+                remaining[m] -= 1
+                if not remaining[m]:
+                    results[m] = hist_quantiles(hists.pop(m), (.5, .025, .975))
+            # no reference to a histogram outlives its sum
+            del finished, future, hist
+    for m in range(len(apply_ifr.ifrs)):
+        if m not in results:
+            results[m] = np.tile(point[:, m], (3, 1))
+    return regions, [results[m] for m in range(len(apply_ifr.ifrs))]
+
+def show_overall_ifr_intervals(regions, results):
+    def header():
+        for i in apply_ifr.ifrs:
+            print(f'| {i[0]:>25} ', end='')
+        print('| Region |')
+    # Sort by the median according to the first model
+    order = np.argsort(-results[0][0], kind='stable')
+    header()
+    for r in order:
+        for res in results:
+            (med, lo, hi) = res[:, r]
+            print(f'| {med:7.3f} ({lo:7.3f}-{hi:7.3f}) ', end='')
+        print(f'| {regions[r]} |')
+    header()
+
+def main():
+    parser = argparse.ArgumentParser(description='Calculate the median and 95% '
+            'interval of the overall IFR of every region by Monte Carlo '
+            'simulation.')
+    parser.add_argument('--draws', type=int, default=100_000,
+            help='number of draws per model (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+            help='random seed (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+            help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--memory', type=int, default=256,
+            help='memory budget per process for the samples and the '
+            'histograms, in MB (default: %(default)s)')
+    parser.add_argument('--year', type=int, default=2020,
+            help='reference year of the pyramids (default: %(default)s)')
+    args = parser.parse_args()
+    apply_ifr.parse_pyramids(args.year)
+    try:
+        results = calc_overall_ifr_intervals(args.draws, args.seed, args.workers,
+                args.memory)
+    except ValueError as e:
+        parser.error(f'argument --memory: {e}')
+    show_overall_ifr_intervals(*results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+#
+# Compact store of population pyramids with the hierarchy of the UN file.
+# Author: Marc Bevand — @zorinaq
+#
+# A Pyramids object holds one contiguous regions × age groups array of people,
+# and for each region its name, its type, its UN code and the code of its
+# parent. Rows are regions of any type: countries, subregions, SDG regions,
+# World... Label/Separator rows have no data (NaN) but are kept, as they are
+# parents in the hierarchy.
+#
+# In the UN file, every country is the child of a subregion, itself the child
+# of an SDG (sub)region, up to World. Aggregates can thus be recomputed from the
+# countries: this is used to check the aggregate rows given by the UN, and to
+# build pyramids for custom groupings of regions (see group). Geographic regions
+# (Africa, Europe...), development groups and income groups have no children in
+# the file, so they cannot be recomputed.
+
+import argparse
+import json
+import numpy as np
+
+# Type of the regions at the bottom of the hierarchy
+leaf_type = 'Country/Area'
+
+class Pyramids:
+    def __init__(self, regions, values, types=None, codes=None, parents=None):
+        # Without a hierarchy, regions are countries without a parent
+        n = len(regions)
+        self.regions = list(regions)
+        self.values = np.asarray(values, dtype=float).reshape(n, -1)
+        self.types = list(types) if types is not None else [leaf_type] * n
+        self.codes = np.asarray(codes if codes is not None else -1 - np.arange(n), dtype=np.int64)
+        self.parents = np.asarray(parents if parents is not None else np.zeros(n), dtype=np.int64)
+        self.index = {r: i for (i, r) in enumerate(self.regions)}
+        # arrays derived from values by the scripts, calculated once (such as
+        # apply_ifr.pyramids_cumulative_people)
+        self.derived = {}
+
+    def __len__(self):
+        return len(self.regions)
+
+    def row(self, region):
+        # Returns the people of <region> in each age group
+        return self.values[self.index[region]]
+
+    def select(self, types):
+        # Returns the regions of the given types, in the same order
+        rows = [i for (i, t) in enumerate(self.types) if t in types]
+        return Pyramids([self.regions[i] for i in rows], self.values[rows],
+                [self.types[i] for i in rows], self.codes[rows], self.parents[rows])
+
+    def ancestry(self):
+        # Returns two arrays (<ancestor rows>, <leaf rows>) holding one pair for
+        # every ancestor of every leaf (country), found one level of the
+        # hierarchy at a time for all leaves at once
+        order = np.argsort(self.codes)
+        pos = np.searchsorted(self.codes[order], self.parents)
+        pos = np.minimum(pos, len(order) - 1)
+        parent_row = np.where(self.codes[order][pos] == self.parents, order[pos], -1)
+        leaves = np.array([i for (i, t) in enumerate(self.types) if t == leaf_type], dtype=np.int64)
+        (ancestors, descendants) = ([], [])
+        current = parent_row[leaves]
+        while (current >= 0).any():
+            found = current >= 0
+            ancestors.append(current[found])
+            descendants.append(leaves[found])
+            (leaves, current) = (leaves[found], parent_row[current[found]])
+        if not ancestors:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(ancestors), np.concatenate(descendants)
+
+    def rollup(self):
+        # Returns the pyramid of every region recomputed as the sum of the
+        # countries below it (zero where there are none), and the number of those
+        # countries. The sum is a single sparse (ancestor, leaf) accumulation.
+        (ancestors, leaves) = self.ancestry()
+        out = np.zeros(self.values.shape)
+        np.add.at(out, ancestors, self.values[leaves])
+        return out, np.bincount(ancestors, minlength=len(self))
+
+    def check(self):
+        # Compares the UN's aggregate rows with the sum of their countries.
+        # Returns a list of (<region>, <type>, <countries>, <people given>,
+        # <people recomputed>, <largest difference in an age group>).
+        (rolled, counts) = self.rollup()
+        out = []
+        for i in np.flatnonzero(counts):
+            if np.isnan(self.values[i]).any():
+                continue
+            diff = np.abs(rolled[i] - self.values[i]).max()
+            out.append((self.regions[i], self.types[i], int(counts[i]),
+                float(self.values[i].sum()), float(rolled[i].sum()), float(diff)))
+        return out
+
+    def group(self, groups):
+        # Returns the Pyramids of custom groupings of regions, from <groups>:
+        # {<name>: [<region>, ...]}. Raises ValueError for an unknown region.
+        for (name, members) in groups.items():
+            for r in members:
+                if r not in self.index:
+                    raise ValueError(f'group {name!r}: unknown region {r!r}')
+        names = list(groups)
+        rows = np.array([g for (g, name) in enumerate(names) for _ in groups[name]], dtype=np.int64)
+        members = np.array([self.index[r] for name in names for r in groups[name]], dtype=np.int64)
+        out = np.zeros((len(names), self.values.shape[1]))
+        np.add.at(out, rows, self.values[members])
+        return Pyramids(names, out, ['Custom group'] * len(names))
+
+def read_groups(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def main():
+    import apply_ifr
+    parser = argparse.ArgumentParser(description='Check the aggregate pyramids of '
+            'the UN file against the sum of their countries.')
+    parser.add_argument('--year', type=int, default=2020,
+            help='reference year of the pyramids (default: %(default)s)')
+    args = parser.parse_args()
+    pyramids = apply_ifr.load_all_pyramids(args.year)
+    print('| Type              | Countries |         Given |    Recomputed | Max diff | Region |')
+    for (region, t, n, given, rolled, diff) in pyramids.check():
+        print(f'| {t:17} | {n:9} | {given:13,.0f} | {rolled:13,.0f} | {diff:8,.0f} | {region} |')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+#
+# Compare every COVID-19 IFR estimate with every seasonal influenza IFR
+# estimate of covid_vs_flu.py, at every age, instead of only their geometric
+# means at a few ages like the chart does.
+# Author: Marc Bevand — @zorinaq
+#
+# The comparison is a (COVID-19 model × flu model × age 0 to maxage) tensor of
+# IFR ratios, NaN where either model has no IFR (see covid_vs_flu.model_curve)
+# or the flu IFR is zero. It is cached in cache_dir, keyed by the models and the
+# interpolation anchor, and summarized as heatmaps (ratio of every pair of
+# models at a given age) and quantile bands (distribution of the ratios of all
+# pairs at each age).
+
+import argparse
+import hashlib
+import os
+import numpy as np
+import covid_vs_flu
+
+cache_dir = '.cache'
+
+def ratio_tensor(ifrs_covid, ifrs_flu, anchor=.5):
+    # Returns the len(ifrs_covid) × len(ifrs_flu) × ages tensor of IFR ratios
+    ages = np.arange(covid_vs_flu.maxage + 1)
+    if anchor == .5:
+        curve = covid_vs_flu.compile_model
+    else:
+        curve = lambda m: covid_vs_flu.model_curve(m, ages, anchor)[0]
+    covid = np.array([curve(m) for m in ifrs_covid])
+    flu = np.array([curve(m) for m in ifrs_flu])
+    flu = np.where(flu > 0, flu, np.nan)
+    return covid[:, None, :] / flu[None, :, :]
+
+class Ratios:
+    def __init__(self, covid, flu, tensor):
+        self.covid = covid
+        self.flu = flu
+        self.tensor = tensor
+        self.ages = np.arange(tensor.shape[2])
+
+    def ratio(self, covid, flu, age):
+        # Ratio of the IFR of the COVID-19 model named <covid> over that of the
+        # flu model named <flu> at <age> (NaN if undefined)
+        return float(self.tensor[self.covid.index(covid), self.flu.index(flu), age])
+
+    def heatmap(self, age):
+        # covid × flu matrix of the ratios at <age>
+        return self.tensor[:, :, age]
+
+    def bands(self, qs=(.05, .25, .5, .75, .95)):
+        # len(qs) × ages array: quantiles of the ratios of all the pairs of models
+        # defined at each age (NaN where none is)
+        pairs = self.tensor.reshape(-1, len(self.ages))
+        out = np.full((len(qs), len(self.ages)), np.nan)
+        defined = ~np.isnan(pairs).all(axis=0)
+        out[:, defined] = np.nanquantile(pairs[:, defined], qs, axis=0)
+        return out
+
+    def mean_ratio(self):
+        # Geometric mean of the ratios of all the pairs of models defined at each
+        # age: the ratio of the geometric means of the COVID-19 and flu IFRs
+        # shown on the chart of covid_vs_flu.py
+        pairs = self.tensor.reshape(-1, len(self.ages))
+        valid = ~np.isnan(pairs)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            logs = np.where(valid, np.log(np.where(valid, pairs, 1)), 0)
+            return np.exp(logs.sum(axis=0) / valid.sum(axis=0))
+
+def fingerprint(ifrs_covid, ifrs_flu, anchor):
+    data = ([(name, sorted(m.items())) for (name, m) in ifrs_covid],
+            [(name, sorted(m.items())) for (name, m) in ifrs_flu],
+            anchor, covid_vs_flu.maxage)
+    return hashlib.sha1(repr(data).encode()).hexdigest()
+
+def load_ratios(ifrs_covid=covid_vs_flu.ifrs_covid, ifrs_flu=covid_vs_flu.ifrs_flu,
+        anchor=.5):
+    # Returns the Ratios of the models, from the cache when available
+    path = os.path.join(cache_dir, f'ratios-{fingerprint(ifrs_covid, ifrs_flu, anchor)}.npy')
+    if os.path.exists(path):
+        tensor = np.load(path)
+    else:
+        tensor = ratio_tensor(ifrs_covid, ifrs_flu, anchor)
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first so concurrent runs never see a partial file
+        tmp = f'{path}.tmp{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            np.save(f, tensor)
+        os.replace(tmp, path)
+    return Ratios([name for (name, _) in ifrs_covid], [name for (name, _) in ifrs_flu], tensor)
+
+def show_table(ratios, ages, qs=(.05, .5, .95)):
+    bands = ratios.bands(qs)
+    mean = ratios.mean_ratio()
+    print('| Age | Pairs | Mean ratio |' + ''.join(f' {100 * q:g}th pct |' for q in qs))
+    for age in ages:
+        n = int((~np.isnan(ratios.tensor[:, :, age])).sum())
+        print(f'| {age:3} | {n:5} | {mean[age]:10.1f} |' + ''.join(
+            f' {x:{len(f"{100 * q:g}th pct")}.1f} |' for (q, x) in zip(qs, bands[:, age])))
+
+def render_heatmaps(path, ratios, ages):
+    # One heatmap of log10(ratio) per age in <ages>
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    cols = min(3, len(ages))
+    rows = -(-len(ages) // cols)
+    fig, axes = plt.subplots(rows, cols, figsize=(3 * cols + 2, 3.5 * rows + 1.5),
+            squeeze=False, sharex=True, sharey=True, layout='constrained')
+    logs = np.log10(np.where(ratios.tensor > 0, ratios.tensor, np.nan))
+    (vmin, vmax) = (np.nanmin(logs[:, :, ages]), np.nanmax(logs[:, :, ages]))
+    for (ax, age) in zip(axes.flat, ages):
+        im = ax.imshow(logs[:, :, age], vmin=vmin, vmax=vmax, cmap='viridis', aspect='auto')
+        ax.set_title(f'Age {age}')
+    # model names on the outer axes only
+    for ax in axes[-1]:
+        ax.set_xticks(range(len(ratios.flu)))
+        ax.set_xticklabels(ratios.flu, rotation=90, fontsize='x-small')
+    for ax in axes[:, 0]:
+        ax.set_yticks(range(len(ratios.covid)))
+        ax.set_yticklabels(ratios.covid, fontsize='x-small')
+    for ax in axes.flat[len(ages):]:
+        ax.axis('off')
+    fig.colorbar(im, ax=axes, label='log10(COVID-19 IFR / flu IFR)')
+    fig.suptitle('IFR ratio of every COVID-19 vs. seasonal influenza estimate')
+    fig.savefig(path, bbox_inches='tight', dpi=150)
+    plt.close(fig)
+
+def render_bands(path, ratios, qs=(.05, .25, .5, .75, .95)):
+    # Median ratio of all the pairs of models at each age, with shaded bands
+    # between symmetric quantiles, and the ratio of the geometric means
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    bands = ratios.bands(qs)
+    fig, ax = plt.subplots(figsize=(8, 6))
+    for i in range(len(qs) // 2):
+        ax.fill_between(ratios.ages, bands[i], bands[-1 - i], color='tab:red',
+                alpha=.15 * (i + 1), lw=0,
+                label=f'{100 * qs[i]:g}th-{100 * qs[-1 - i]:g}th percentile')
+    if len(qs) % 2:
+        ax.plot(ratios.ages, bands[len(qs) // 2], color='tab:red',
+                label=f'{100 * qs[len(qs) // 2]:g}th percentile')
+    ax.plot(ratios.ages, ratios.mean_ratio(), color='black', ls='dashed',
+            label='ratio of geometric means')
+    ax.semilogy()
+    ax.grid(True, which='major', linewidth=0.3)
+    ax.set_xlim(left=0)
+    ax.set_xlabel('Age')
+    ax.set_ylabel('COVID-19 IFR / flu IFR')
+    ax.legend(frameon=False, fontsize='small')
+    fig.suptitle('IFR ratio of all pairs of COVID-19 and seasonal influenza estimates')
+    fig.savefig(path, bbox_inches='tight', dpi=150)
+    plt.close(fig)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare every COVID-19 IFR '
+            'estimate with every seasonal influenza IFR estimate, at every age.')
+    parser.add_argument('--ages', type=int, nargs='+', default=list(range(30, 90, 10)),
+            help='ages of the table and the heatmaps (default: %(default)s)')
+    parser.add_argument('--anchor', type=float, default=.5,
+            help='interpolation anchor within each age group (default: %(default)s)')
+    parser.add_argument('--heatmaps', metavar='FILE',
+            help='also draw the heatmaps of the ratios at --ages to FILE')
+    parser.add_argument('--bands', metavar='FILE',
+            help='also draw the quantile bands of the ratios to FILE')
+    args = parser.parse_args()
+    if not all(0 <= age <= covid_vs_flu.maxage for age in args.ages):
+        parser.error(f'ages must be between 0 and {covid_vs_flu.maxage}')
+    ratios = load_ratios(anchor=args.anchor)
+    show_table(ratios, args.ages)
+    if args.heatmaps:
+        render_heatmaps(args.heatmaps, ratios, args.ages)
+    if args.bands:
+        render_bands(args.bands, ratios)
+
+if __name__ == '__main__':
+    main()
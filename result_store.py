@@ -0,0 +1,83 @@
+# Persistent store of overall IFRs, so that only the (region, model) cells whose
+# pyramid or model changed have to be calculated again.
+# Author: Marc Bevand — @zorinaq
+#
+# Each cell is keyed by the fingerprint of the pyramid of the region (not its
+# name) and the fingerprint of the age-stratified IFR table of the model (not
+# its name), so that editing a model or a pyramid invalidates exactly the cells
+# depending on it.
+
+import hashlib
+import sqlite3
+import time
+import numpy as np
+
+def pyramid_fingerprint(groups, split='uniform'):
+    # <groups>: people in each age group, in the order of apply_ifr.age_groups,
+    # <split>: how they are split into single years of age
+    h = hashlib.sha1(np.ascontiguousarray(groups, dtype='<f8').tobytes())
+    if split != 'uniform':
+        h.update(split.encode())
+    return h.hexdigest()
+
+def model_fingerprint(ifr_age_stratified):
+    # <ifr_age_stratified>: {<age group>: <IFR>}
+    return hashlib.sha1(repr(sorted(ifr_age_stratified.items())).encode()).hexdigest()
+
+class ResultStore:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS cells (
+                pyramid TEXT NOT NULL,
+                model TEXT NOT NULL,
+                ifr REAL NOT NULL,
+                PRIMARY KEY (pyramid, model)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS models (
+                model TEXT PRIMARY KEY,
+                name TEXT,
+                last_used REAL NOT NULL
+            );
+        ''')
+
+    def close(self):
+        self.db.close()
+
+    def lookup(self, pyramid_keys, model_keys, model_names=None):
+        # Returns a len(pyramid_keys) × len(model_keys) array of the stored
+        # overall IFRs, NaN where a cell is missing, and marks the models as used
+        rows = {key: i for (i, key) in enumerate(pyramid_keys)}
+        out = np.full((len(pyramid_keys), len(model_keys)), np.nan)
+        now = time.time()
+        names = model_names or [None] * len(model_keys)
+        with self.db:
+            for (j, (model, name)) in enumerate(zip(model_keys, names)):
+                self.db.execute('INSERT INTO models VALUES (?, ?, ?) ON CONFLICT(model) '
+                        'DO UPDATE SET name = excluded.name, last_used = excluded.last_used',
+                        (model, name, now))
+                for (pyramid, ifr) in self.db.execute(
+                        'SELECT pyramid, ifr FROM cells WHERE model = ?', (model,)):
+                    if pyramid in rows:
+                        out[rows[pyramid], j] = ifr
+        return out
+
+    def insert(self, cells):
+        # <cells>: iterable of (pyramid key, model key, overall IFR)
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO cells VALUES (?, ?, ?)', cells)
+
+    def evict(self, registered, grace=7 * 86400):
+        # Deletes the cells of the models that are not in <registered> (model
+        # keys) and have not been used for <grace> seconds. Returns the number of
+        # models evicted.
+        cutoff = time.time() - grace
+        placeholders = ','.join('?' * len(registered))
+        with self.db:
+            stale = [m for (m,) in self.db.execute(
+                f'SELECT model FROM models WHERE last_used < ? '
+                f'AND model NOT IN ({placeholders})', (cutoff, *registered))]
+            for model in stale:
+                self.db.execute('DELETE FROM cells WHERE model = ?', (model,))
+                self.db.execute('DELETE FROM models WHERE model = ?', (model,))
+        return len(stale)
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+#
+# Project the number of deaths in every region, according to every IFR model of
+# apply_ifr.py, under a grid of attack-rate scenarios. The grid is evaluated by
+# a process pool (shared_executor.py) whose workers share the attack rates, the
+# pyramids, the compiled IFR models and the results with this process, and
+# checkpointed so that an interrupted run resumes where it stopped.
+# Author: Marc Bevand — @zorinaq
+#
+# A scenario is an attack-rate profile: the fraction of the people of each age
+# group of apply_ifr.age_groups who get infected. Scenarios are read from a CSV
+# file with a name column and one column per age group, labelled like in the UN
+# file ('0-4', '5-9', ..., '95-99', '100+'), or generated with --attack-rate as
+# a range of rates that are the same at all ages.
+#
+# Results are written to a directory holding:
+#   deaths.npy      scenarios × regions × models array of expected deaths
+#   scenarios.txt   names of the scenarios, one per line
+#   regions.txt     names of the regions, one per line
+#   progress.json   what the results were calculated from, and which chunks of
+#                   scenarios are done
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+import numpy as np
+import apply_ifr
+import shared_executor
+from shared_executor import SharedExecutor
+
+def read_scenarios(path, name_column):
+    # Returns the names of the scenarios of <path> and a scenarios × age_groups
+    # array of attack rates
+    import pandas as pd
+    columns = [apply_ifr.ag2str(ag) for ag in apply_ifr.age_groups]
+    df = pd.read_csv(path, dtype={name_column: str}, usecols=[name_column] + columns)
+    return list(df[name_column]), df[columns].to_numpy(dtype=float)
+
+def uniform_scenarios(start, stop, num):
+    rates = np.linspace(start, stop, int(num))
+    return [f'{x:g}' for x in rates], np.repeat(rates[:, None], len(apply_ifr.age_groups), axis=1)
+
+def deaths_matrix(groups, ifr, split='uniform'):
+    # Returns an age_groups × (regions × models) matrix: the number of deaths in
+    # each region according to each model if all the people of an age group, and
+    # nobody else, got infected. <ifr> is the single-year-ages × models matrix
+    # of the IFRs of the models (see apply_ifr.ifr_matrix). Since the attack
+    # rate of a scenario is the same at all ages of an age group, the deaths of a
+    # chunk of scenarios are the product of their attack rates by this matrix.
+    people = apply_ifr.expand_age_groups(groups, split)
+    out = np.empty((len(apply_ifr.age_groups), people.shape[0], ifr.shape[1]))
+    for (j, (a, b)) in enumerate(apply_ifr.age_groups):
+        out[j] = people[:, a:b + 1] @ ifr[a:b + 1] / 100.0
+    return out.reshape(len(apply_ifr.age_groups), -1)
+
+# deaths_matrix of the shared pyramids and models, calculated by each worker
+# process for its first task
+_deaths = None
+
+def run_task(i, start, stop, split):
+    # Calculates the deaths of the scenarios <start> to <stop>, written straight
+    # into the results on disk. The arrays are shared by project.
+    global _deaths
+    arrays = shared_executor.arrays
+    if _deaths is None:
+        (ifr, _) = apply_ifr.compiled_ifr_matrix(arrays['ifr'][arrays['rows']])
+        _deaths = deaths_matrix(arrays['pyramids'], ifr, split)
+    out = arrays['results'][start:stop].reshape(stop - start, -1)
+    np.matmul(arrays['attack'][start:stop], _deaths, out=out)
+    return i
+
+class Progress:
+    # Output directory of a grid, with the results written so far. <key> holds
+    # what they are calculated from: if it differs from the key of an existing
+    # directory, the previous results are discarded.
+    def __init__(self, path, key, shape, nchunks, names, regions):
+        self.path = path
+        self.file = os.path.join(path, 'progress.json')
+        os.makedirs(path, exist_ok=True)
+        state = None
+        if os.path.exists(self.file):
+            with open(self.file, encoding='utf-8') as f:
+                state = json.load(f)
+            if state['key'] != key:
+                state = None
+        deaths = os.path.join(path, 'deaths.npy')
+        if state is None:
+            self.deaths = np.lib.format.open_memmap(deaths, 'w+', float, shape)
+            self.done = [False] * nchunks
+            for (name, lines) in (('scenarios.txt', names), ('regions.txt', regions)):
+                with open(os.path.join(path, name), 'w', encoding='utf-8') as f:
+                    f.write(''.join(f'{x}\n' for x in lines))
+        else:
+            self.deaths = np.load(deaths, mmap_mode='r+')
+            self.done = state['done']
+        self.key = key
+        self.checkpoint()
+
+    def checkpoint(self):
+        # The results are flushed before the chunks are recorded as done, and
+        # progress.json is replaced atomically, so that a run killed at any time
+        # never records a chunk whose results are not on disk
+        self.deaths.flush()
+        tmp = self.file + f'.tmp{os.getpid()}'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'key': self.key, 'done': self.done}, f)
+        os.replace(tmp, self.file)
+
+def project(names, attack, output, year=2020, split='uniform', chunk_size=1000,
+        workers=None, checkpoint_every=10):
+    # Calculates the deaths of the chunks of scenarios that are not done yet in
+    # <output>. Returns (progress, number of chunks calculated by this call, the
+    # SharedExecutor that calculated them).
+    workers = workers or os.cpu_count()
+    (regions, groups) = apply_ifr.load_pyramids(year)
+    rows = np.array(apply_ifr.registry_rows(apply_ifr.ifrs), dtype=np.int64)
+    h = hashlib.sha1(np.ascontiguousarray(attack, dtype='<f8').tobytes())
+    h.update(np.ascontiguousarray(groups, dtype='<f8').tobytes())
+    h.update(apply_ifr.registry.ifr[rows].astype('<f8').tobytes())
+    key = f'{h.hexdigest()}-{split}-{chunk_size}'
+    shape = (len(names), len(regions), len(apply_ifr.ifrs))
+    nchunks = -(-len(names) // chunk_size)
+    progress = Progress(output, key, shape, nchunks, names, regions)
+    todo = (i for i in range(nchunks) if not progress.done[i])
+    calculated = 0
+    last = time.monotonic()
+    # workers write to the memory-mapped results of <progress>; only the indices
+    # of the chunks go through the pool
+    shared = {'attack': np.asarray(attack, dtype=float), 'pyramids': groups,
+            'ifr': apply_ifr.registry.ifr, 'rows': rows, 'results': progress.deaths}
+    try:
+        with SharedExecutor(shared, workers) as executor:
+            pending = set()
+            while True:
+                # at most 2 chunks per worker are in flight at any time
+                while len(pending) < 2 * workers:
+                    i = next(todo, None)
+                    if i is None:
+                        break
+                    (start, stop) = (i * chunk_size, min((i + 1) * chunk_size, len(names)))
+                    pending.add(executor.submit(run_task, i, start, stop, split,
+                        units=stop - start))
+                if not pending:
+                    break
+                (finished, pending) = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    progress.done[future.result()] = True
+                    calculated += 1
+                if time.monotonic() - last >= checkpoint_every:
+                    progress.checkpoint()
+                    last = time.monotonic()
+    finally:
+        # also on KeyboardInterrupt: the chunks already written are kept
+        progress.checkpoint()
+    return progress, calculated, executor
+
+def show_summary(progress, region='WORLD'):
+    # Shows the quantiles, across scenarios, of the deaths in <region>
+    with open(os.path.join(progress.path, 'regions.txt'), encoding='utf-8') as f:
+        regions = f.read().splitlines()
+    if region not in regions:
+        return
+    deaths = np.asarray(progress.deaths[:, regions.index(region)])
+    print(f'Deaths in {region} across {deaths.shape[0]} scenarios')
+    print('| Quantile ' + ''.join(f'| {name:>15} ' for (name, _) in apply_ifr.ifrs) + '|')
+    for q in (0, .025, .5, .975, 1):
+        print(f'| {q:8.3f} ' + ''.join(f'| {x:15,.0f} '
+            for x in np.quantile(deaths, q, axis=0)) + '|')
+
+def main():
+    parser = argparse.ArgumentParser(description='Project the deaths in every '
+            'region under a grid of attack-rate scenarios.')
+    parser.add_argument('scenarios', nargs='?',
+            help='CSV file of attack-rate profiles by age group')
+    parser.add_argument('--attack-rate', nargs=3, type=float,
+            metavar=('START', 'STOP', 'NUM'),
+            help='instead of a file, use NUM attack rates from START to STOP, '
+            'the same at all ages')
+    parser.add_argument('--name-column', default='Name',
+            help='column holding the names of the scenarios (default: %(default)s)')
+    parser.add_argument('--output', default='scenarios',
+            help='output directory (default: %(default)s)')
+    parser.add_argument('--year', type=int, default=2020,
+            help='reference year of the pyramids (default: %(default)s)')
+    parser.add_argument('--split', choices=apply_ifr.splits, default='uniform',
+            help='how to split 5-year age groups into single years of age '
+            '(default: %(default)s)')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+            help='scenarios per chunk (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+            help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--checkpoint-every', type=float, default=10, metavar='SECONDS',
+            help='save the progress every SECONDS (default: %(default)s)')
+    args = parser.parse_args()
+    if (args.scenarios is None) == (args.attack_rate is None):
+        parser.error('give either a scenario file or --attack-rate')
+    if args.scenarios:
+        (names, attack) = read_scenarios(args.scenarios, args.name_column)
+    else:
+        (names, attack) = uniform_scenarios(*args.attack_rate)
+    if not len(names):
+        sys.exit('no scenarios')
+    (progress, calculated, executor) = project(names, attack, args.output, args.year,
+            args.split, args.chunk_size, args.workers, args.checkpoint_every)
+    print(f'{calculated} of {len(progress.done)} chunks calculated, '
+            f'results in {args.output}')
+    if calculated:
+        shared_executor.show_throughput(executor, 'scenarios')
+    show_summary(progress)
+
+if __name__ == '__main__':
+    main()
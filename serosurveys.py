@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+#
+# Calculate the age-stratified IFR from any number of serosurveys at once, like
+# calc_ifr.py does for the Spanish one.
+# Author: Marc Bevand — @zorinaq
+#
+# Surveys are read from a JSON file holding a list of objects with the keys:
+#   name           name of the survey, shown in the report
+#   region         country or area whose pyramid is used, as named in the UN
+#                  file of apply_ifr.py
+#   year           reference year of the pyramid (default: 2020)
+#   prevalence     [[<first age>, <last age>, <prevalence in %>], ...]
+#   total_deaths   total number of deaths, including those with unknown age
+#   deaths         [[<first age>, <last age>, <number of deaths>], ...]
+#   sources        (optional) list of URLs
+# See serosurveys.json. Prevalence and death brackets do not have to match:
+# both are mapped to single years of age 0 to apply_ifr.maxage, and ages past
+# maxage are counted at maxage. Brackets of the same kind must not overlap. Like
+# in calc_ifr.py, the deaths with unknown age are distributed proportionally
+# among brackets.
+
+import argparse
+import json
+import sys
+import numpy as np
+import apply_ifr
+import calc_ifr
+
+def read_surveys(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def check_surveys(surveys):
+    # Raises ValueError if the prevalence or death brackets of a survey are
+    # invalid or overlap (people or deaths would be counted twice)
+    for s in surveys:
+        for key in ('prevalence', 'deaths'):
+            brackets = sorted((a, b) for (a, b, _) in s[key])
+            for (a, b) in brackets:
+                if not 0 <= a <= b:
+                    raise ValueError(f'{s["name"]}: invalid {key} bracket {a}-{b}')
+            for ((a1, b1), (a2, b2)) in zip(brackets, brackets[1:]):
+                if a2 <= b1:
+                    raise ValueError(f'{s["name"]}: {key} brackets {a1}-{b1} and '
+                            f'{a2}-{b2} overlap')
+
+def load_people(surveys, split='uniform'):
+    # Returns a surveys × single-year-ages array: the pyramid of the region of
+    # each survey
+    groups = np.empty((len(surveys), len(apply_ifr.age_groups)))
+    by_year = {}
+    for (i, s) in enumerate(surveys):
+        by_year.setdefault(s.get('year', 2020), []).append(i)
+    for (year, indices) in by_year.items():
+        (regions, values) = apply_ifr.load_pyramids(year)
+        index = {r: j for (j, r) in enumerate(regions)}
+        for i in indices:
+            s = surveys[i]
+            if s['region'] not in index:
+                sys.exit(f'{s["name"]}: no pyramid for {s["region"]} in {year}')
+            groups[i] = values[index[s['region']]]
+    return apply_ifr.expand_age_groups(groups, split)
+
+def bracket_arrays(surveys, key):
+    # Returns three surveys × max(brackets) arrays: the first and last age of the
+    # brackets of <key>, clipped to maxage, and their values. Surveys with fewer
+    # brackets are padded with empty brackets (last age below first age).
+    n = max(len(s[key]) for s in surveys)
+    first = np.zeros((len(surveys), n), dtype=int)
+    last = np.full((len(surveys), n), -1)
+    values = np.zeros((len(surveys), n))
+    for (i, s) in enumerate(surveys):
+        for (j, (a, b, val)) in enumerate(s[key]):
+            (first[i, j], last[i, j], values[i, j]) = (a, min(b, apply_ifr.maxage), val)
+    return first, last, values
+
+def calc_surveys(surveys, people):
+    # Returns three surveys × (max(death brackets) + 1) arrays, laid out like in
+    # calc_ifr.run: the infected, the deaths (after redistribution of those with
+    # unknown age) and the IFR (in %) of each death bracket, followed by all ages.
+    # Brackets including ages without a prevalence have a NaN IFR; padding
+    # brackets are NaN. Raises ValueError if brackets are invalid (see
+    # check_surveys).
+    check_surveys(surveys)
+    ages = np.arange(apply_ifr.maxage + 1)
+    # prevalence at each single year of age, NaN where the survey has none
+    (first, last, values) = bracket_arrays(surveys, 'prevalence')
+    inside = (ages >= first[..., None]) & (ages <= last[..., None])
+    prevalence = np.where(inside.any(axis=1), (inside * values[..., None]).sum(axis=1), np.nan)
+    infected = people * np.nan_to_num(prevalence) / 100.0
+    # prefix sums of the infected and of the ages without prevalence
+    cum = np.zeros((len(surveys), len(ages) + 1))
+    np.cumsum(infected, axis=1, out=cum[:, 1:])
+    missing = np.zeros((len(surveys), len(ages) + 1))
+    np.cumsum(np.isnan(prevalence), axis=1, out=missing[:, 1:])
+    (first, last, deaths) = bracket_arrays(surveys, 'deaths')
+    first = np.concatenate((first, np.zeros((len(surveys), 1), dtype=int)), axis=1)
+    last = np.concatenate((last, np.full((len(surveys), 1), apply_ifr.maxage)), axis=1)
+    valid = last >= first
+    last = np.maximum(last, first - 1)
+    infected = (np.take_along_axis(cum, last + 1, axis=1) -
+            np.take_along_axis(cum, first, axis=1))
+    uncovered = (np.take_along_axis(missing, last + 1, axis=1) -
+            np.take_along_axis(missing, first, axis=1)) > 0
+    total = np.array([s['total_deaths'] for s in surveys], dtype=float)
+    deaths = deaths * (total / deaths.sum(axis=1))[:, None]
+    deaths = np.concatenate((deaths, total[:, None]), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ifrs = np.where(valid & ~uncovered, 100.0 * deaths / infected, np.nan)
+    return (np.where(valid, infected, np.nan), np.where(valid, deaths, np.nan), ifrs)
+
+def show_surveys(surveys, infected, deaths, ifrs):
+    for (i, s) in enumerate(surveys):
+        print(f'{s["name"]} ({s["region"]}, {s.get("year", 2020)} pyramid)')
+        brackets = [(a, b) for (a, b, _) in s['deaths']]
+        brackets.append((brackets[0][0], brackets[-1][1]))
+        # the last column holds all ages
+        for (j, bracket) in zip(list(range(len(brackets) - 1)) + [-1], brackets):
+            print(calc_ifr.format_line(bracket, infected[i, j], deaths[i, j], ifrs[i, j]))
+        print()
+
+def run(path, split='uniform'):
+    surveys = read_surveys(path)
+    if not surveys:
+        sys.exit('no surveys')
+    try:
+        check_surveys(surveys)
+    except ValueError as e:
+        sys.exit(str(e))
+    people = load_people(surveys, split)
+    show_surveys(surveys, *calc_surveys(surveys, people))
+
+def main():
+    parser = argparse.ArgumentParser(description='Calculate the age-stratified '
+            'IFR from serosurveys read from a JSON file.')
+    parser.add_argument('surveys', nargs='?', default='serosurveys.json',
+            help='JSON file of serosurveys (default: %(default)s)')
+    parser.add_argument('--split', choices=apply_ifr.splits, default='uniform',
+            help='how to split 5-year age groups into single years of age '
+            '(default: %(default)s)')
+    args = parser.parse_args()
+    run(args.surveys, args.split)
+
+if __name__ == '__main__':
+    main()
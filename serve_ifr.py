@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+#
+# Local HTTP service answering overall IFR queries from memory: the pyramids are
+# loaded and all the overall IFRs are calculated once, at startup or on reload.
+# Author: Marc Bevand — @zorinaq
+#
+# Endpoints (all responses are JSON):
+#   GET  /models                          list of models
+#   GET  /regions                         list of regions
+#   GET  /ifr?region=R[&model=M]          overall IFR(s) of a region
+#   POST /batch  {"regions": [...], "models": [...]}
+#                                         overall IFRs of many regions (models
+#                                         are optional, default: all)
+#   GET  /top?model=M[&k=20][&order=desc] regions with the highest (or lowest)
+#                                         overall IFR according to a model
+#                                         (regions without one are left out)
+#   GET  /percentile?model=M&q=50[&q=90]  percentiles of the overall IFR across
+#                                         regions
+# Overall IFRs that could not be calculated (invalid pyramids) are null.
+#   POST /reload                          reload the pyramids and the models,
+#                                         without interrupting queries
+
+import argparse
+import asyncio
+import importlib
+import json
+import sys
+import time
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+import apply_ifr
+import export_ifr
+
+class Snapshot:
+    # Immutable view of the data used to answer queries: a region index, and a
+    # regions × models array of overall IFRs with, for each model, the regions
+    # sorted by decreasing overall IFR (those without one, NaN, left out)
+    def __init__(self, year):
+        (self.regions, groups) = apply_ifr.load_pyramids(year)
+        self.models = [name for (name, _) in apply_ifr.ifrs]
+        self.oifrs = apply_ifr.overall_ifr_matrix(groups, apply_ifr.ifrs)
+        self.region_index = {r: i for (i, r) in enumerate(self.regions)}
+        self.model_index = {m: j for (j, m) in enumerate(self.models)}
+        self.order = [col[~np.isnan(self.oifrs[col, j])] for (j, col) in
+                enumerate(np.argsort(-self.oifrs, axis=0, kind='stable').T)]
+        self.loaded = time.time()
+
+    def model(self, name):
+        if name not in self.model_index:
+            raise KeyError(f'unknown model: {name}')
+        return self.model_index[name]
+
+    def region(self, name):
+        if name not in self.region_index:
+            raise KeyError(f'unknown region: {name}')
+        return self.region_index[name]
+
+    def ifr(self, region, models=None):
+        i = self.region(region)
+        models = models or self.models
+        return {m: float(self.oifrs[i, self.model(m)]) for m in models}
+
+    def top(self, model, k, descending=True):
+        j = self.model(model)
+        order = self.order[j] if descending else self.order[j][::-1]
+        return [(self.regions[i], float(self.oifrs[i, j])) for i in order[:k]]
+
+    def percentile(self, model, qs):
+        return np.nanpercentile(self.oifrs[:, self.model(model)], qs).tolist()
+
+def json_safe(result):
+    # Returns <result> with its non-finite floats replaced by None (see
+    # export_ifr.json_value)
+    if isinstance(result, float):
+        return export_ifr.json_value(result)
+    if isinstance(result, dict):
+        return {k: json_safe(v) for (k, v) in result.items()}
+    if isinstance(result, (list, tuple)):
+        return [json_safe(v) for v in result]
+    return result
+
+def param(q, name):
+    # Returns the values of a query parameter
+    if name not in q:
+        raise ValueError(f'missing parameter: {name}')
+    return q[name]
+
+class Service:
+    def __init__(self, year):
+        self.year = year
+        self.snapshot = Snapshot(year)
+        # reloads are serialized: modules must not be reloaded by two threads
+        # at once
+        self.reload_lock = asyncio.Lock()
+
+    async def reload(self):
+        # The new snapshot is built in a thread; queries keep being answered
+        # from the old one until it is swapped in
+        def build():
+            # ifr_models.py first, for the modules that imported it, then
+            # apply_ifr, which rebuilds the registry from ifr_models.py
+            if 'ifr_models' in sys.modules:
+                importlib.reload(sys.modules['ifr_models'])
+            importlib.reload(apply_ifr)
+            return Snapshot(self.year)
+        async with self.reload_lock:
+            self.snapshot = await asyncio.get_running_loop().run_in_executor(None, build)
+        return {'regions': len(self.snapshot.regions), 'models': len(self.snapshot.models)}
+
+    async def handle_request(self, method, target, body):
+        url = urlsplit(target)
+        q = parse_qs(url.query)
+        s = self.snapshot
+        if method == 'GET' and url.path == '/models':
+            return s.models
+        if method == 'GET' and url.path == '/regions':
+            return s.regions
+        if method == 'GET' and url.path == '/ifr':
+            return s.ifr(param(q, 'region')[0], q.get('model'))
+        if method == 'POST' and url.path == '/batch':
+            req = json.loads(body)
+            return {r: s.ifr(r, req.get('models')) for r in param(req, 'regions')}
+        if method == 'GET' and url.path == '/top':
+            k = int(q.get('k', ['20'])[0])
+            if k <= 0:
+                raise ValueError(f'k must be a positive integer: {k}')
+            descending = q.get('order', ['desc'])[0] != 'asc'
+            return s.top(param(q, 'model')[0], k, descending)
+        if method == 'GET' and url.path == '/percentile':
+            qs = param(q, 'q')
+            return dict(zip(qs, s.percentile(param(q, 'model')[0], [float(x) for x in qs])))
+        if method == 'POST' and url.path == '/reload':
+            return await self.reload()
+        raise LookupError(f'no such endpoint: {method} {url.path}')
+
+    async def handle_connection(self, reader, writer):
+        # Minimal HTTP/1.1 server with keep-alive
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                (method, target, version) = line.decode('latin-1').split()
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    (name, _, value) = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    (status, result) = ('200 OK', await self.handle_request(method, target, body))
+                except LookupError as e:
+                    (status, result) = ('404 Not Found', {'error': str(e.args[0])})
+                except (ValueError, TypeError) as e:
+                    (status, result) = ('400 Bad Request', {'error': str(e)})
+                payload = json.dumps(json_safe(result), allow_nan=False).encode()
+                close = headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0'
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                        f'Content-Length: {len(payload)}\r\n'
+                        f'Connection: {"close" if close else "keep-alive"}\r\n\r\n'.encode()
+                        + payload)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(host, port, year):
+    service = Service(year)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f'Serving {len(service.snapshot.regions)} regions × '
+            f'{len(service.snapshot.models)} models on http://{host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve overall IFR queries over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1',
+            help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8020,
+            help='port to listen on (default: %(default)s)')
+    parser.add_argument('--year', type=int, default=2020,
+            help='reference year of the pyramids (default: %(default)s)')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.year))
+
+if __name__ == '__main__':
+    main()
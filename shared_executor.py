@@ -0,0 +1,132 @@
+# Process pool whose workers share arrays with the parent process instead of
+# receiving copies of them.
+# Author: Marc Bevand — @zorinaq
+#
+# The arrays given to a SharedExecutor are placed once in shared memory
+# (multiprocessing.shared_memory), except arrays memory-mapped from a file
+# (np.memmap, np.load with mmap_mode), which every worker maps from the same
+# file. Workers find them, as numpy arrays without any copy, in the dict
+# shared_executor.arrays: tasks only need to carry small arguments such as row
+# indices, and can write their results straight into a shared output array.
+# The time spent by every worker in its tasks is recorded, so that the
+# throughput of each worker can be reported (see throughput).
+
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+# Arrays shared with this worker process, by name (set by init_worker)
+arrays = {}
+
+# Shared memory blocks mapped by this worker, kept open as long as the process
+_blocks = []
+
+def describe(array, block=None):
+    # Returns a picklable description of <array>, from which attach maps it:
+    # a memory-mapped file, or the shared memory <block> holding it
+    if block is not None:
+        return ('shm', block.name, array.shape, array.dtype.str)
+    mode = 'r+' if array.flags.writeable and array.mode != 'c' else 'r'
+    return ('file', array.filename, array.offset, array.shape, array.dtype.str, mode)
+
+def attach(spec):
+    if spec[0] == 'shm':
+        (_, name, shape, dtype) = spec
+        block = shared_memory.SharedMemory(name)
+        _blocks.append(block)
+        return np.ndarray(shape, dtype, buffer=block.buf)
+    (_, filename, offset, shape, dtype, mode) = spec
+    return np.memmap(filename, dtype, mode, offset, shape)
+
+def init_worker(specs):
+    for (name, spec) in specs.items():
+        arrays[name] = attach(spec)
+
+def run_task(fn, args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return os.getpid(), time.perf_counter() - start, result
+
+class SharedExecutor:
+    # Usage:
+    #   with SharedExecutor({'people': people, 'out': out}, workers) as executor:
+    #       executor.submit(fn, <arguments>, units=<work done by the task>)
+    # where fn is a module-level function reading shared_executor.arrays. The
+    # parent sees the shared arrays in executor.arrays: writes of the workers to
+    # an array copied to shared memory are only visible there, until the
+    # executor is shut down.
+    def __init__(self, shared, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.blocks = []
+        self.arrays = {}
+        specs = {}
+        for (name, array) in shared.items():
+            if isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap):
+                self.arrays[name] = array
+                specs[name] = describe(array)
+                continue
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.blocks.append(block)
+            self.arrays[name] = np.ndarray(array.shape, array.dtype, buffer=block.buf)
+            self.arrays[name][...] = array
+            specs[name] = describe(array, block)
+        # {<worker pid>: [<tasks>, <units>, <seconds in tasks>]}
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.executor = ProcessPoolExecutor(self.workers, initializer=init_worker,
+                initargs=(specs,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(cancel_futures=exc_type is not None)
+
+    def shutdown(self, cancel_futures=False):
+        self.executor.shutdown(wait=True, cancel_futures=cancel_futures)
+        self.elapsed = time.perf_counter() - self.start
+        self.arrays.clear()
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def submit(self, fn, *args, units=1):
+        # Runs fn(*args) in a worker. Returns a Future of its result.
+        future = Future()
+        def done(f):
+            try:
+                (pid, elapsed, result) = f.result()
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            with self.lock:
+                stats = self.stats.setdefault(pid, [0, 0, 0.])
+                stats[0] += 1
+                stats[1] += units
+                stats[2] += elapsed
+            future.set_result(result)
+        self.executor.submit(run_task, fn, args).add_done_callback(done)
+        return future
+
+    def throughput(self):
+        # Returns a list of (<worker pid>, <tasks>, <units>, <seconds in tasks>)
+        with self.lock:
+            return [(pid, *stats) for (pid, stats) in sorted(self.stats.items())]
+
+def show_throughput(executor, unit='units'):
+    stats = executor.throughput()
+    print(f'| Worker  | Tasks | {unit:>10} | Busy (s) | {unit + "/s":>12} |')
+    for (pid, tasks, units, busy) in stats:
+        print(f'| {pid:7} | {tasks:5} | {units:10,} | {busy:8.2f} | '
+                f'{units / busy if busy else 0:12,.0f} |')
+    total = sum(units for (_, _, units, _) in stats)
+    elapsed = getattr(executor, 'elapsed', time.perf_counter() - executor.start)
+    print(f'{total:,} {unit} in {elapsed:.2f} s with {executor.workers} workers: '
+            f'{total / elapsed:,.0f} {unit}/s')
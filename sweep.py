@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+#
+# Sensitivity sweep: evaluate the COVID-19 vs. seasonal influenza comparisons
+# over a grid of values of the scalar assumptions made by the other scripts,
+# instead of their single hardcoded values:
+# - cdc_sympt, the symptomatic fraction of influenza infections (covid_vs_flu.py
+#   and apply_ifr.py use .33, the literature gives 15-35%)
+# - the fraction of the deaths with unknown age that are redistributed among age
+#   brackets when calculating the ENE-COVID IFR (calc_ifr.py uses all of them)
+# - where the IFR of an age group is anchored for interpolation, as a fraction
+#   of the way from its first to its last age (covid_vs_flu.py uses the middle)
+# Author: Marc Bevand — @zorinaq
+#
+# Two ratio surfaces are calculated:
+# - age_ratio[sympt, unknown, anchor, age]: geometric mean of the COVID-19 IFRs
+#   over geometric mean of the influenza IFRs (covid_vs_flu.py)
+# - region_ratio[sympt, unknown, region, model]: overall IFR of each COVID-19
+#   model over the overall IFR of influenza (apply_ifr.py)
+
+import argparse
+import numpy as np
+import apply_ifr
+import calc_ifr
+import covid_vs_flu
+
+def unknown_deaths_scale(unknown):
+    # Factor applied to the ENE-COVID IFRs when only the fraction <unknown> of the
+    # deaths with unknown age are redistributed, instead of all of them
+    known = sum(calc_ifr.deaths_by_age.values())
+    return (known + np.asarray(unknown) * (calc_ifr.total_deaths - known)) / calc_ifr.total_deaths
+
+def log_gmean(curves, axis):
+    # Log of the geometric mean along <axis>, ignoring NaNs
+    valid = ~np.isnan(curves)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.where(valid, np.log(np.where(valid, curves, 1)), 0)
+        return logs.sum(axis=axis) / valid.sum(axis=axis)
+
+def chunks(n, size):
+    for start in range(0, n, size):
+        yield slice(start, min(n, start + size))
+
+def age_ratio(sympt, unknown, anchors, chunk):
+    # Returns the age_ratio surface; the flu axis (sympt) is processed <chunk>
+    # values at a time
+    ages = np.arange(covid_vs_flu.maxage + 1)
+    # anchors × models × ages
+    covid = np.array([[covid_vs_flu.model_curve(m, ages, a)[0]
+        for m in covid_vs_flu.ifrs_covid] for a in anchors])
+    flu = np.array([[covid_vs_flu.model_curve(m, ages, a)[0]
+        for m in covid_vs_flu.ifrs_flu] for a in anchors])
+    # unknown × anchors × models × ages
+    scale = np.ones((len(unknown), len(covid_vs_flu.ifrs_covid)))
+    ene = [name for (name, _) in covid_vs_flu.ifrs_covid].index('ENE-COVID')
+    scale[:, ene] = unknown_deaths_scale(unknown)
+    covid = covid[None] * scale[:, None, :, None]
+    log_covid = log_gmean(covid, axis=2)
+    out = np.empty((len(sympt), len(unknown), len(anchors), len(ages)))
+    for s in chunks(len(sympt), chunk):
+        # sympt × anchors × models × ages
+        f = flu[None] * (sympt[s] / covid_vs_flu.cdc_sympt)[:, None, None, None]
+        out[s] = np.exp(log_covid[None] - log_gmean(f, axis=2)[:, None])
+    return out
+
+def region_ratio(sympt, unknown, chunk, regions, groups):
+    # Returns the region_ratio surface of the pyramids <groups> of <regions>, the
+    # regions and the COVID-19 models; the flu axis (sympt) is processed <chunk>
+    # values at a time
+    people = apply_ifr.expand_age_groups(groups)
+    (ifr, _) = apply_ifr.ifr_matrix(apply_ifr.ifrs)
+    names = [name for (name, _) in apply_ifr.ifrs]
+    is_flu = np.array([name.startswith('Flu:') for name in names])
+    ene = names.index('ENE-COVID')
+    pop = people.sum(axis=1)
+    out = np.empty((len(sympt), len(unknown), len(regions), (~is_flu).sum()))
+    for s in chunks(len(sympt), chunk):
+        # parameters (sympt × unknown) × ages × models
+        scale = np.ones((len(sympt[s]), len(unknown), len(names)))
+        scale[:, :, ene] = unknown_deaths_scale(unknown)[None, :]
+        scale[:, :, is_flu] = (sympt[s] / apply_ifr.cdc_sympt)[:, None, None]
+        ifrs = ifr[None, None] * scale[:, :, None, :]
+        # parameters × regions × models
+        oifrs = np.einsum('ra,suam->surm', people, ifrs) / pop[:, None]
+        out[s] = oifrs[..., ~is_flu] / oifrs[..., is_flu][..., :1]
+    return out, regions, [n for (n, f) in zip(names, is_flu) if not f]
+
+def grid(values):
+    (start, stop, num) = values
+    return np.linspace(start, stop, int(num))
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep the scalar assumptions of '
+            'the COVID-19 vs. seasonal influenza comparisons.')
+    parser.add_argument('--sympt', nargs=3, type=float, default=(.15, .35, 9),
+            metavar=('START', 'STOP', 'NUM'),
+            help='symptomatic fraction of flu infections (default: %(default)s)')
+    parser.add_argument('--unknown-deaths', nargs=3, type=float, default=(0, 1, 5),
+            metavar=('START', 'STOP', 'NUM'),
+            help='fraction of ENE-COVID deaths with unknown age that are '
+            'redistributed (default: %(default)s)')
+    parser.add_argument('--anchor', nargs=3, type=float, default=(.25, .75, 5),
+            metavar=('START', 'STOP', 'NUM'),
+            help='interpolation anchor within each age group (default: %(default)s)')
+    parser.add_argument('--memory', type=int, default=256,
+            help='memory budget for intermediate arrays, in MB (default: %(default)s)')
+    parser.add_argument('--output', default='sweep.npz',
+            help='output file (default: %(default)s)')
+    args = parser.parse_args()
+    (sympt, unknown, anchors) = grid(args.sympt), grid(args.unknown_deaths), grid(args.anchor)
+    (regions, groups) = apply_ifr.load_pyramids()
+    budget = args.memory * 2**20 // 8
+    # largest intermediate per sympt value: unknown × anchors × flu models × ages
+    # in age_ratio, and unknown × ages × models plus unknown × regions × models
+    # in region_ratio
+    per_sympt = max(len(unknown) * len(anchors) * len(covid_vs_flu.ifrs_flu) *
+            (covid_vs_flu.maxage + 1), len(unknown) * len(apply_ifr.ifrs) *
+            (apply_ifr.maxage + 1 + len(regions)))
+    chunk = max(1, budget // per_sympt)
+    ages = age_ratio(sympt, unknown, anchors, chunk)
+    (regions_ratio, regions, models) = region_ratio(sympt, unknown, chunk, regions, groups)
+    np.savez(args.output, sympt=sympt, unknown_deaths=unknown, anchor=anchors,
+            age=np.arange(covid_vs_flu.maxage + 1), age_ratio=ages,
+            region=np.array(regions), model=np.array(models),
+            region_ratio=regions_ratio)
+    # summary: COVID-19/flu ratio at the ages of the chart, all deaths
+    # redistributed and anchors in the middle of age groups
+    u = np.argmin(np.abs(unknown - 1))
+    f = np.argmin(np.abs(anchors - .5))
+    print(f'COVID-19/flu IFR ratio (unknown deaths {unknown[u]:g}, anchor {anchors[f]:g})')
+    print('| Sympt. |' + ''.join(f' Age {a:2} |' for a in range(30, 90, 10)))
+    for (i, s) in enumerate(sympt):
+        print(f'| {s:6.3f} |' + ''.join(f' {ages[i, u, f, a]:6.1f} |'
+            for a in range(30, 90, 10)))
+    print(f'Surfaces written to {args.output}')
+
+if __name__ == '__main__':
+    main()
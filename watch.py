@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+#
+# Keep the outputs of the scripts up to date while their inputs are edited:
+# the overall IFR table and the calc_ifr.py output in README.md, the chart of
+# covid_vs_flu.py, and optional exports of the table.
+# Author: Marc Bevand — @zorinaq
+#
+# The input files are polled. When one changes, the modules depending on it are
+# reloaded, and only the outputs whose inputs actually changed are rebuilt: each
+# output has a fingerprint of the data it is made from (the pyramids, the
+# entries of the models it uses, the code producing it), so that editing a flu
+# model only used by the chart does not rebuild the table, and editing the
+# style of the chart does not rebuild anything else. The parsed pyramids, the
+# overall IFRs of unchanged models and the figure are kept in memory between
+# rebuilds.
+
+import argparse
+import contextlib
+import hashlib
+import importlib
+import io
+import os
+import sys
+import time
+import traceback
+import apply_ifr
+import batch_render
+import calc_ifr
+import covid_vs_flu
+import export_ifr
+from result_store import ResultStore
+
+file_readme = 'README.md'
+
+# Modules to reload, in this order, when a file changes
+reloads = {
+        'ifr_models.py': ('apply_ifr', 'covid_vs_flu'),
+        'export_ifr.py': ('export_ifr', 'apply_ifr'),
+        'apply_ifr.py': ('apply_ifr',),
+        'calc_ifr.py': ('calc_ifr',),
+        'covid_vs_flu.py': ('covid_vs_flu',),
+}
+order = ('export_ifr', 'apply_ifr', 'calc_ifr', 'covid_vs_flu')
+
+def source_hash(*modules):
+    h = hashlib.sha1()
+    for m in modules:
+        with open(m.__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def models_repr(models):
+    return repr([(name, sorted(m.items())) for (name, m) in models])
+
+def replace_table(lines, table):
+    # Replaces the overall IFR table following the '## Results' heading
+    i = lines.index('## Results')
+    while not lines[i].startswith('|'):
+        i += 1
+    j = i
+    while j < len(lines) and lines[j].startswith('|'):
+        j += 1
+    return lines[:i] + table + lines[j:]
+
+def replace_calc(lines, calc):
+    # Replaces the output of calc_ifr.py following the '$ ./calc_ifr.py' line
+    i = lines.index('$ ./calc_ifr.py') + 1
+    return lines[:i] + calc + lines[lines.index('```', i):]
+
+class Watcher:
+    def __init__(self, year=2020, chart='covid_vs_flu.png', exports=()):
+        self.year = year
+        self.chart = chart
+        self.exports = exports
+        self.files = [apply_ifr.file_pyramids] + list(reloads)
+        self.mtimes = {f: self.mtime(f) for f in self.files}
+        self.fingerprints = {}
+        # overall IFRs by pyramid and model, so that only the models that
+        # changed are calculated again
+        self.store = ResultStore(':memory:')
+        self.fig = None
+        self.load_pyramids()
+
+    @staticmethod
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load_pyramids(self):
+        apply_ifr.parse_pyramids(self.year)
+        self.pyramids = apply_ifr.pyramids
+        self.pyramids_hash = apply_ifr.file_hash(apply_ifr.file_pyramids)
+
+    def changed(self):
+        # Returns the input files modified since the last call
+        out = []
+        for f in self.files:
+            m = self.mtime(f)
+            if m != self.mtimes[f]:
+                self.mtimes[f] = m
+                out.append(f)
+        return out
+
+    def reload(self, files):
+        modules = {m for f in files for m in reloads.get(f, ())}
+        for name in order:
+            if name in modules:
+                importlib.reload(sys.modules[name])
+        if apply_ifr.file_pyramids in files:
+            self.load_pyramids()
+        else:
+            # keep the pyramids parsed before the reload
+            apply_ifr.pyramids = self.pyramids
+
+    def table(self):
+        (regions, oifrs) = apply_ifr.calc_overall_ifr_matrix(self.store)
+        models = [name for (name, _) in apply_ifr.ifrs]
+        (regions, oifrs) = export_ifr.sort_table(regions, models, oifrs)
+        return regions, models, oifrs
+
+    def outputs(self):
+        # Returns {<output>: (<fingerprint>, <function building it>)}
+        table_fp = hashlib.sha1(repr((self.pyramids_hash, self.year,
+            models_repr(apply_ifr.ifrs), source_hash(apply_ifr, export_ifr))).encode()).hexdigest()
+        out = {
+                'README.md table': (table_fp, self.build_readme_table),
+                'README.md calc_ifr.py output': (source_hash(calc_ifr), self.build_readme_calc),
+        }
+        if self.chart:
+            job = {'output': self.chart}
+            out[self.chart] = (batch_render.fingerprint(job, batch_render.resolve(job)),
+                    self.build_chart)
+        for path in self.exports:
+            out[path] = (table_fp, lambda path=path: self.build_export(path))
+        return out
+
+    def update_readme(self, edit):
+        with open(file_readme, encoding='utf-8') as f:
+            text = f.read()
+        new = '\n'.join(edit(text.split('\n')))
+        if new != text:
+            with open(file_readme, 'w', encoding='utf-8') as f:
+                f.write(new)
+
+    def build_readme_table(self):
+        table = export_ifr.format_text(*self.table(), markdown=True)
+        self.update_readme(lambda lines: replace_table(lines, table.splitlines()))
+
+    def build_readme_calc(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            calc_ifr.run(argparse.Namespace(bootstrap=0, seed=0, surveys=None))
+        # the README quotes the IFR by bracket, not the closing remark
+        calc = [l for l in out.getvalue().splitlines() if l.startswith('Ages')]
+        self.update_readme(lambda lines: replace_calc(lines, calc))
+
+    def build_chart(self):
+        if self.fig is None:
+            self.fig = batch_render.plt.figure()
+        job = {'output': self.chart}
+        inputs = batch_render.resolve(job)
+        covid_vs_flu.render(self.chart, inputs['covid'], inputs['flu'], inputs['lang'],
+                inputs['style'], fig=self.fig)
+        manifest = batch_render.load_manifest()
+        manifest[self.chart] = batch_render.fingerprint(job, inputs)
+        batch_render.save_manifest(manifest)
+
+    def build_export(self, path):
+        fmt = {'.md': 'markdown', '.txt': 'text', '.csv': 'csv', '.jsonl': 'jsonl',
+                '.parquet': 'parquet', '.arrow': 'arrow'}[os.path.splitext(path)[1]]
+        export_ifr.write_table(*self.table(), fmt, path)
+
+    def build(self, initial=False):
+        # Rebuilds the outputs whose fingerprint changed, and returns their names
+        # and build times. Initially, the chart is only rendered if it is missing
+        # or out of date according to the manifest of batch_render.py.
+        rebuilt = []
+        for (name, (fp, build)) in self.outputs().items():
+            if self.fingerprints.get(name) == fp:
+                continue
+            if initial and name == self.chart and os.path.exists(self.chart) and \
+                    batch_render.load_manifest().get(self.chart) == fp:
+                self.fingerprints[name] = fp
+                continue
+            start = time.perf_counter()
+            build()
+            # only once built: an output whose build failed is built again at
+            # the next step
+            self.fingerprints[name] = fp
+            rebuilt.append((name, time.perf_counter() - start))
+        return rebuilt
+
+    def step(self, initial=False):
+        start = time.perf_counter()
+        files = [] if initial else self.changed()
+        if not initial and not files:
+            return
+        try:
+            self.reload(files)
+            rebuilt = self.build(initial)
+        except Exception:
+            # an input may be saved half-edited: report and wait for the next change
+            traceback.print_exc()
+            return
+        elapsed = time.perf_counter() - start
+        changes = ', '.join(files) if files else 'startup'
+        done = ', '.join(f'{name} ({t:.2f} s)' for (name, t) in rebuilt)
+        print(f'{time.strftime("%H:%M:%S")} {changes}: ' + (f'rebuilt {done}, '
+            f'{elapsed:.2f} s in total' if rebuilt else 'up to date'), flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the outputs of the '
+            'scripts whenever their inputs change.')
+    parser.add_argument('--year', type=int, default=2020,
+            help='reference year of the pyramids (default: %(default)s)')
+    parser.add_argument('--chart', default='covid_vs_flu.png',
+            help='output file of the chart, empty for none (default: %(default)s)')
+    parser.add_argument('--export', action='append', default=[], metavar='FILE',
+            help='also keep an export of the overall IFR table up to date; the '
+            'format is given by the extension (.md, .txt, .csv, .jsonl, '
+            '.parquet, .arrow). Can be repeated.')
+    parser.add_argument('--interval', type=float, default=.25,
+            help='polling interval, in seconds (default: %(default)s)')
+    parser.add_argument('--once', action='store_true',
+            help='bring the outputs up to date and exit')
+    args = parser.parse_args()
+    watcher = Watcher(args.year, args.chart, args.export)
+    watcher.step(initial=True)
+    if args.once:
+        return
+    try:
+        while True:
+            time.sleep(args.interval)
+            watcher.step()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()